@@ -0,0 +1,39 @@
+"""Measure attribute-read throughput on loaded CheddarGetter objects.
+
+Reads the fields a reporting loop typically reads, over customers decoded
+from a recorded-style payload, and prints the reads per second for each.
+
+    $ python benchmarks/attributes.py [customers] [passes]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import Customer, xmlbackend
+import fixtures
+
+READS = [
+    ('customer.email', lambda customer: customer.email),
+    ('customer.code', lambda customer: customer.code),
+    ('customer.subscription', lambda customer: customer.subscription),
+    ('subscription.plan_code', lambda customer: customer.subscription.plan_code),
+    ('...plan.recurring_charge_amount', lambda customer: customer.subscription.plan.recurring_charge_amount),
+    ('subscription.items[0].quantity', lambda customer: customer.subscription.items[0].quantity),
+    ('plan.items[0].quantity', lambda customer: customer.subscription.plan.items[0].quantity),
+]
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    passes = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    xml = xmlbackend.backend.fromstring(fixtures.customers(count, 1))
+    customers = [Customer.from_xml(customer_xml) for customer_xml in xml.findall('customer')]
+
+    for name, read in READS:
+        start = time.time()
+        for i in range(passes):
+            for customer in customers:
+                read(customer)
+        elapsed = time.time() - start
+        print '%-34s %10.0f reads/s' % (name, count * passes / elapsed)
@@ -0,0 +1,48 @@
+"""Compare the XML backends on a large /customers/get/ payload.
+
+For each backend available (see pycheddar.xmlbackend), times parsing the
+whole response at once, walking it incrementally as Customer.iter_search()
+does, and parsing and decoding it into Customer objects.
+
+    $ python benchmarks/backends.py [customers] [invoices per customer]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import Customer, xmlbackend
+from parse import best_of
+import fixtures
+
+
+def walk(backend, content):
+    """Walk the payload incrementally, throwing each
+    customer away once it has been seen."""
+
+    root = None
+    for action, element in backend.iterparse(content, ('start', 'end')):
+        if root is None:
+            root = element
+        elif action == 'end' and element.tag == 'customer':
+            root.clear()
+
+
+def decode(backend, content):
+    """Parse the payload and decode every customer in it."""
+
+    return [Customer.from_xml(customer_xml) for customer_xml in backend.fromstring(content).findall('customer')]
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    invoices = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    content = fixtures.customers(count, invoices)
+
+    print '%d customers (%d KB)' % (count, len(content) / 1024)
+    for name in xmlbackend.available():
+        backend = xmlbackend.get_backend(name)
+        parse = best_of(lambda: backend.fromstring(content))
+        iterparse = best_of(lambda: walk(backend, content))
+        total = best_of(lambda: decode(backend, content))
+        print '%-14s parse %.3fs, iterparse %.3fs, parse + decode %.3fs, %.0f customers/s' % (
+            name, parse, iterparse, total, count / total)
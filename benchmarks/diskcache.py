@@ -0,0 +1,60 @@
+"""Benchmark a report run with and without the on-disk customer cache.
+
+Runs a small "report" (Customer.all(), then Customer.get() for every
+customer) against the fake CheddarGetter three times: without a cache,
+with an empty SQLiteCache, and again with a fresh SQLiteCache object on the
+same file, as a new process would.
+
+    $ python benchmarks/diskcache.py [--customers 200] [--latency 0.05]
+"""
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import CheddarGetter, Customer
+from pycheddar.cache import SQLiteCache
+from pycheddar.fakeserver import FakeCheddarGetter
+
+
+def report(server, customers):
+    """Run the report; return how long it took, and how many
+    requests it sent."""
+
+    before = sum(server.stats().values())
+    start = time.time()
+    for customer in Customer.all():
+        customer.email
+    for i in range(customers):
+        Customer.get('CUSTOMER_%d' % i)
+    return time.time() - start, sum(server.stats().values()) - before
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--customers', type = 'int', default = 200, help = 'customers in the fake product')
+    parser.add_option('--latency', type = 'float', default = 0.05, help = 'seconds of simulated latency per request')
+    options, args = parser.parse_args()
+
+    server = FakeCheddarGetter(latency = options.latency)
+    server.populate(customers = options.customers)
+    CheddarGetter.set_server(server.start())
+    CheddarGetter.set_product_code(server.product_code)
+
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'customers.db')
+    try:
+        for name, cache in (('no cache', None), ('cold cache', SQLiteCache(filename)), ('warm cache', SQLiteCache(filename))):
+            Customer.set_cache(cache)
+            elapsed, requests = report(server, options.customers)
+            print '%-12s %8.3fs %6d requests' % (name, elapsed, requests)
+    finally:
+        server.stop()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
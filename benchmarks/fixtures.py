@@ -0,0 +1,14 @@
+"""Recorded-style CheddarGetter XML payloads for the benchmarks."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar.fakeserver import customer_xml, plan_xml
+
+
+def plans(count = 5):
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<plans>%s</plans>' % ''.join(plan_xml(n) for n in range(count))
+
+
+def customers(count = 1000, invoices = 12, start = 0):
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<customers>%s</customers>' % ''.join(customer_xml(n, invoices) for n in range(start, start + count))
@@ -0,0 +1,54 @@
+"""Compare getting specific customers one by one with Customer.get_many().
+
+Gets `wanted` customers spread over the fake product with Customer.get()
+for each in turn, then with Customer.get_many() fetching them in parallel,
+and with Customer.get_many() using a single search, and reports the time
+and requests each took.
+
+    $ python benchmarks/getmany.py [--customers 1000] [--wanted 200] [--workers 8]
+"""
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import CheddarGetter, Customer
+from pycheddar.fakeserver import FakeCheddarGetter
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--customers', type = 'int', default = 1000, help = 'customers in the fake product')
+    parser.add_option('--invoices', type = 'int', default = 12, help = 'invoices per customer')
+    parser.add_option('--wanted', type = 'int', default = 200, help = 'customers to get')
+    parser.add_option('--workers', type = 'int', default = 8, help = 'requests sent at once')
+    parser.add_option('--latency', type = 'float', default = 0.05, help = 'seconds of simulated latency per request')
+    parser.add_option('--rate', type = 'int', default = 5000000, help = 'bytes per second CheddarGetter generates responses at')
+    options, args = parser.parse_args()
+
+    server = FakeCheddarGetter(latency = options.latency, rate = options.rate)
+    server.populate(customers = options.customers, invoices = options.invoices)
+    CheddarGetter.set_server(server.start())
+    CheddarGetter.set_product_code(server.product_code)
+    step = max(1, options.customers / options.wanted)
+    codes = ['CUSTOMER_%d' % i for i in range(0, options.customers, step)][:options.wanted]
+
+    def serial():
+        return dict((code, Customer.get(code)) for code in codes)
+
+    try:
+        for name, run in (('Customer.get()', serial),
+                ('get_many() (parallel)', lambda: Customer.get_many(codes, workers = options.workers)[0]),
+                ('get_many() (search)', lambda: Customer.get_many(codes, search = True)[0])):
+            before = sum(server.stats().values())
+            start = time.time()
+            count = len(run())
+            print '%-24s %6d customers %8.3fs %6d requests' % (name, count, time.time() - start,
+                sum(server.stats().values()) - before)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
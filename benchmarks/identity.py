@@ -0,0 +1,37 @@
+"""Measure the memory saved by the customer identity map.
+
+Loads the same customers several times from a recorded-style payload, as
+repeated searches would, keeping every result, and reports the time taken
+and the bytes retained with and without Customer.set_identity_map().
+
+    $ python benchmarks/identity.py [customers] [loads] [invoices per customer]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import Customer, xmlbackend
+from memory import deep_size
+import fixtures
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    loads = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    invoices = int(sys.argv[3]) if len(sys.argv) > 3 else 12
+    content = fixtures.customers(count, invoices)
+
+    for enabled in (False, True):
+        Customer.set_identity_map(enabled)
+        results = []
+        start = time.time()
+        for i in range(loads):
+            xml = xmlbackend.backend.fromstring(content)
+            results.append([Customer.from_xml(customer_xml) for customer_xml in xml.findall('customer')])
+            del xml
+        elapsed = time.time() - start
+
+        total = deep_size(results, set())
+        print '%-20s %d loads of %d customers: %.3fs, %d bytes retained, %s' % (
+            enabled and 'identity map' or 'no identity map', loads, count, elapsed, total, Customer.identity_stats())
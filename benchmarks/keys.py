@@ -0,0 +1,52 @@
+"""Microbenchmark for pycheddar.utils.to_underscores and to_camel_case.
+
+Compares the current implementations against the original loop-based
+ones, over the field names CheddarGetter actually sends.
+
+    $ python benchmarks/keys.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar.utils import to_camel_case, to_underscores
+
+CAMEL_KEYS = ['firstName', 'lastName', 'email', 'company', 'gatewayToken',
+    'createdDatetime', 'modifiedDatetime', 'ccFirstName', 'ccLastName',
+    'ccZip', 'ccType', 'ccLastFour', 'ccExpirationDate', 'canceledDatetime',
+    'setupChargeAmount', 'recurringChargeAmount', 'quantityIncluded',
+    'isPeriodic', 'overageAmount', 'eachAmount', 'billingDatetime']
+UNDERSCORED_KEYS = [to_underscores(key) for key in CAMEL_KEYS]
+
+
+def old_to_underscores(key):
+    match = re.search(r'([A-Z])', key)
+    while match:
+        char = match.groups()[0]
+        key = key.replace(char, '_' + char.lower())
+        match = re.search(r'([A-Z])', key)
+    return key
+
+
+def old_to_camel_case(key):
+    while '_' in key:
+        ix = key.index('_')
+        next = key[ix + 1].upper()
+        key = key[0:ix] + next + key[ix + 2:]
+    return key
+
+
+def run(func, keys, number = 2000):
+    return min(timeit.repeat(lambda: [func(key) for key in keys], number = number, repeat = 3))
+
+
+if __name__ == '__main__':
+    for name, old, new, keys in (
+        ('to_underscores', old_to_underscores, to_underscores, CAMEL_KEYS),
+        ('to_camel_case', old_to_camel_case, to_camel_case, UNDERSCORED_KEYS),
+    ):
+        before = run(old, keys)
+        after = run(new, keys)
+        print '%-16s old %.4fs  new %.4fs  (%.1fx)' % (name, before, after, before / after)
@@ -0,0 +1,70 @@
+"""Measure the memory held by loaded CheddarGetter objects.
+
+Loads customers (with a year of invoices each) from a recorded-style
+payload and reports the bytes retained per customer, counting the
+objects themselves, their data and relation dictionaries and the
+field values, both when everything is decoded up front and when
+lists of child objects are loaded lazily (and so kept as XML), and
+when every subscription decodes its own plan rather than sharing
+one Plan per plan (see Plan.set_interning).
+
+    $ python benchmarks/memory.py [customers] [invoices per customer]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import CheddarObject, Customer, Plan, _Deferred, xmlbackend
+from xml.etree import ElementTree
+import fixtures
+
+
+def deep_size(obj, seen):
+    """Return the size in bytes of obj and everything it refers to
+    that has not been counted already."""
+
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += deep_size(value, seen)
+    elif isinstance(obj, CheddarObject):
+        for name in CheddarObject.__slots__:
+            if name != '__weakref__' and hasattr(obj, name):
+                size += deep_size(object.__getattribute__(obj, name), seen)
+        if hasattr(obj, '__dict__'):
+            size += deep_size(obj.__dict__, seen)
+    elif isinstance(obj, _Deferred):
+        size += deep_size(obj.xml, seen)
+    elif ElementTree.iselement(obj):
+        # count elements through their interface, so that C
+        # implementations are measured the same way
+        for value in (obj.tag, obj.attrib, obj.text, obj.tail):
+            size += deep_size(value, seen)
+        for child in obj:
+            size += deep_size(child, seen)
+        if hasattr(obj, '__dict__'):
+            size += deep_size(obj.__dict__, seen)
+    return size
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    invoices = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+
+    content = fixtures.customers(count, invoices)
+    for name, lazy, interning in (('eager', False, True), ('eager, unshared plans', False, False), ('lazy', True, True)):
+        Plan.set_interning(interning)
+        xml = xmlbackend.backend.fromstring(content)
+        customers = [Customer.from_xml(customer_xml, lazy = lazy) for customer_xml in xml.findall('customer')]
+        del xml
+
+        total = deep_size(customers, set())
+        print '%s (%s): %d customers, %d invoices each: %d bytes total, %d bytes per customer' % (
+            name, xmlbackend.backend.name, count, invoices, total, total / count)
@@ -0,0 +1,60 @@
+"""Compare Customer.search() with Customer.paged_search().
+
+Runs against the fake CheddarGetter, with a fixed latency per request
+plus a delay proportional to the size of each response (as CheddarGetter
+takes longer to generate large responses), and reports the time to the
+first customer and the total time for each.
+
+    $ python benchmarks/paging.py [--customers 2000] [--days 30] [--workers 4]
+"""
+import datetime
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import CheddarGetter, Customer
+from pycheddar.fakeserver import FakeCheddarGetter
+
+
+def measure(name, customers):
+    """Consume an iterator of customers, printing the time to
+    the first one and the total time."""
+
+    start = time.time()
+    first = None
+    count = 0
+    for customer in customers:
+        if first is None:
+            first = time.time() - start
+        count += 1
+    print '%-24s %6d customers, first after %.3fs, all after %.3fs' % (name, count, first, time.time() - start)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--customers', type = 'int', default = 2000, help = 'customers in the fake product (two are created a day)')
+    parser.add_option('--invoices', type = 'int', default = 12, help = 'invoices per customer')
+    parser.add_option('--latency', type = 'float', default = 0.05, help = 'seconds of simulated latency per request')
+    parser.add_option('--rate', type = 'int', default = 5000000, help = 'bytes per second CheddarGetter generates responses at')
+    parser.add_option('--days', type = 'int', default = 30, help = 'days per page')
+    parser.add_option('--workers', type = 'int', default = 4, help = 'pages fetched at once')
+    options, args = parser.parse_args()
+
+    server = FakeCheddarGetter(latency = options.latency, rate = options.rate)
+    server.populate(customers = options.customers, invoices = options.invoices)
+    CheddarGetter.set_server(server.start())
+    CheddarGetter.set_product_code(server.product_code)
+
+    try:
+        start = datetime.date(2010, 1, 1)
+        end = start + datetime.timedelta(days = options.customers / 2)
+        measure('Customer.iter_search()', Customer.iter_search())
+        measure('Customer.paged_search()', Customer.paged_search(start, end, days = options.days, workers = options.workers))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark decoding of /customers/get/ responses into Customer objects.
+
+Times XML parsing (with the backend in use; see benchmarks/backends.py
+to compare backends) and object decoding separately over a large
+recorded-style payload, decoding both eagerly and lazily; "lazy + email"
+reads each customer's email only, which is all that lazy decoding
+is meant to make cheap, and "lazy + invoices" also reads every
+invoice and charge. "eager, unshared plans" decodes every subscription's
+plan rather than sharing one Plan per plan (see Plan.set_interning).
+
+    $ python benchmarks/parse.py [customers] [invoices per customer]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import Customer, Plan, xmlbackend
+import fixtures
+
+
+def best_of(func, repeat = 3):
+    """Return the fastest of several runs of func, in seconds."""
+
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    invoices = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    content = fixtures.customers(count, invoices)
+    backend = xmlbackend.backend
+    xml = backend.fromstring(content)
+
+    parse = best_of(lambda: backend.fromstring(content))
+    print '%d customers (%d KB): parse %.3fs with %s' % (count, len(content) / 1024, parse, backend.name)
+
+    def email(lazy):
+        for customer_xml in xml.findall('customer'):
+            Customer.from_xml(customer_xml, lazy = lazy).email
+
+    def charges(lazy):
+        for customer_xml in xml.findall('customer'):
+            for invoice in Customer.from_xml(customer_xml, lazy = lazy).subscription.invoices:
+                invoice.charges
+
+    def unshared():
+        Plan.set_interning(False)
+        try:
+            email(False)
+        finally:
+            Plan.set_interning(True)
+
+    for name, func in (('eager', lambda: email(False)), ('eager, unshared plans', unshared),
+            ('lazy + email', lambda: email(True)), ('lazy + invoices', lambda: charges(True))):
+        decode = best_of(func)
+        print '%s: decode %.3fs, %.0f customers/s decoded' % (name, decode, count / decode)
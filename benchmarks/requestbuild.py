@@ -0,0 +1,81 @@
+"""Microbenchmark for building requests (CheddarGetter._build_url).
+
+Compares the compiled endpoints (see pycheddar.endpoints) against the
+original builder, which matched a regular expression against every code,
+copied the keyword arguments, camel-cased them one by one and urlencoded
+them separately, over the requests pycheddar sends most often.
+
+    $ python benchmarks/requestbuild.py
+"""
+import copy
+import os
+import re
+import sys
+import timeit
+from urllib import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import CheddarGetter
+from pycheddar.utils import to_camel_case
+
+SERVER = 'https://cheddargetter.com'
+PRODUCT_CODE = 'MY_PRODUCT'
+REQUESTS = [
+    ('/customers/add-charge/', dict(code = 'JOHN_SMITH', item_code = 'USERS', charge_code = 'EXTRA',
+        each_amount = '1.00', quantity = 1, description = 'Extra users')),
+    ('/customers/set-item-quantity/', dict(code = 'JOHN_SMITH', item_code = 'USERS', quantity = 5)),
+    ('/customers/get/', dict(code = '4072cc12-5375-102d-86dc-40402145ee8b')),
+    ('/customers/edit/', dict(code = 'JOHN_SMITH', first_name = 'John', last_name = 'Smith',
+        email = 'john.smith@example.com', **{'subscription[plan_code]': 'PREMIUM'})),
+    ('/customers/new/', dict(code = 'JOHN_SMITH', first_name = 'John', last_name = 'Smith',
+        email = 'john.smith@example.com', **{'subscription[plan_code]': 'FREE'})),
+]
+
+
+def old_build(path, code = None, item_code = None, product_code = None, pass_product_code = True, **kwargs):
+    url = '%s/xml/%s' % (SERVER, path.strip('/'))
+    if code is not None:
+        add_to_url = True
+        if path.strip('/')[-3:] == 'new':
+            add_to_url = False
+        code = str(code)
+        if re.match(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', code):
+            if add_to_url is True:
+                url += '/id/' + code
+            else:
+                raise ValueError, 'Cannot send an ID for an object creation request.'
+        else:
+            if add_to_url is True:
+                url += '/code/' + code
+            else:
+                kwargs['code'] = code
+    if item_code is not None:
+        url += '/itemCode/' + item_code
+    for key in copy.copy(kwargs):
+        if '_' in key:
+            kwargs[to_camel_case(key)] = kwargs[key]
+            del kwargs[key]
+    if pass_product_code is True:
+        url += '/productCode/' + (product_code or PRODUCT_CODE) + '/'
+    return url, urlencode(kwargs)
+
+
+def new_build(path, **kwargs):
+    return CheddarGetter._build_url(path, **kwargs)
+
+
+def run(func, number = 20000):
+    return min(timeit.repeat(lambda: [func(path, **kwargs) for path, kwargs in REQUESTS], number = number, repeat = 3))
+
+
+if __name__ == '__main__':
+    CheddarGetter.set_server(SERVER)
+    CheddarGetter.set_product_code(PRODUCT_CODE)
+    for path, kwargs in REQUESTS:
+        assert old_build(path, **kwargs)[0] == new_build(path, **kwargs)[0]
+
+    before = run(old_build)
+    after = run(new_build)
+    calls = 20000 * len(REQUESTS)
+    print 'old %.3fs (%.1f us/request)  new %.3fs (%.1f us/request)  (%.1fx)' % (
+        before, before * 1e6 / calls, after, after * 1e6 / calls, before / after)
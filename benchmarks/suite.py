@@ -0,0 +1,77 @@
+"""End-to-end benchmark suite, run against the bundled fake CheddarGetter.
+
+Measures request construction, full request round trips, XML parsing,
+object construction and the save paths, without touching the real API.
+Run it before and after a change to catch performance regressions:
+
+    $ python benchmarks/suite.py [--customers 500] [--latency 0.0]
+"""
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import CheddarGetter, Customer, Plan
+from pycheddar.fakeserver import FakeCheddarGetter
+
+
+def measure(name, func, number):
+    """Run func `number` times and print the time per call."""
+
+    start = time.time()
+    for i in range(number):
+        func(i)
+    elapsed = time.time() - start
+    print '%-28s %8d calls %10.3f ms/call %10.0f calls/s' % (name, number, elapsed * 1000 / number, number / elapsed)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--customers', type = 'int', default = 500, help = 'customers in the fake product')
+    parser.add_option('--invoices', type = 'int', default = 12, help = 'invoices per customer')
+    parser.add_option('--latency', type = 'float', default = 0.0, help = 'seconds of simulated latency per request')
+    parser.add_option('--number', type = 'int', default = 200, help = 'calls per benchmark')
+    options, args = parser.parse_args()
+
+    server = FakeCheddarGetter(latency = options.latency)
+    server.populate(customers = options.customers, invoices = options.invoices)
+    CheddarGetter.set_server(server.start())
+    CheddarGetter.set_product_code(server.product_code)
+    Plan.set_cache(None)
+    number = options.number
+
+    try:
+        # request overhead, with and without the network
+        measure('build request', lambda i: CheddarGetter._build_url('/customers/add-charge/',
+            code = 'CUSTOMER_1', item_code = 'USERS', charge_code = 'EXTRA', each_amount = '1.00', quantity = 1), number * 100)
+        measure('request /plans/get/', lambda i: CheddarGetter.request('/plans/get/', code = 'PLAN_1'), number)
+
+        # parse cost and object construction, on the full customer list
+        status, content = server.handle('/xml/customers/get/productCode/%s/' % server.product_code, '')
+        xml = CheddarGetter._parse(content)
+        print '(%d customers, %d KB)' % (options.customers, len(content) / 1024)
+        measure('parse /customers/get/', lambda i: CheddarGetter._parse(content), 3)
+        measure('construct customers', lambda i: [Customer.from_xml(customer_xml) for customer_xml in xml.findall('customer')], 3)
+        measure('Customer.all()', lambda i: Customer.all(), 3)
+        measure('Customer.get()', lambda i: Customer.get('CUSTOMER_%d' % (i % options.customers)), number)
+
+        # save paths
+        customers = [Customer.get('CUSTOMER_%d' % (i % options.customers)) for i in range(number)]
+        def edit(i):
+            customers[i].first_name = 'Benchmark%d' % i
+            customers[i].save()
+        measure('Customer.save() (edit)', edit, number)
+        plan = Plan.get('PLAN_0')
+        def new(i):
+            customer = Customer(code = 'BENCH_%d' % i, first_name = 'Bench', last_name = 'Mark', email = 'bench@example.com')
+            customer.subscription.plan = plan
+            customer.save()
+        measure('Customer.save() (new)', new, number)
+        measure('Customer.add_charge()', lambda i: customers[i].add_charge('EXTRA', 'USERS', 1.0), number)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
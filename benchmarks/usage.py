@@ -0,0 +1,85 @@
+"""Compare sending usage one request at a time with a UsageBatcher.
+
+Records the same events (charges and item quantity changes spread over a
+few customers) against the fake CheddarGetter, first with a request per
+event and then through CheddarGetter.batch_usage(), and reports the time
+and number of requests each took.
+
+    $ python benchmarks/usage.py [--events 1000] [--customers 10] [--latency 0.02]
+"""
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pycheddar import CheddarGetter
+from pycheddar.fakeserver import FakeCheddarGetter
+
+
+def events(count, customers):
+    """Return the events to record, as (method, args) pairs."""
+
+    result = []
+    for i in range(count):
+        customer = 'CUSTOMER_%d' % (i % customers)
+        if i % 2:
+            result.append(('add_charge', (customer, 'API_CALLS', None, 0.01, 1)))
+        else:
+            result.append(('add_item_quantity', (customer, 'USERS', 1)))
+    return result
+
+
+def unbatched(usage):
+    """Send each event as its own request."""
+
+    for method, args in usage:
+        if method == 'add_charge':
+            customer, charge, item, amount, quantity = args
+            CheddarGetter.request('/customers/add-charge/', code = customer, charge_code = charge,
+                item_code = item, each_amount = '%.2f' % amount, quantity = quantity)
+        else:
+            customer, item, quantity = args
+            CheddarGetter.request('/customers/add-item-quantity/', code = customer, item_code = item, quantity = quantity)
+
+
+def batched(usage, log):
+    """Record every event with a UsageBatcher, and wait for it to send them."""
+
+    batcher = CheddarGetter.batch_usage(log = log)
+    for method, args in usage:
+        getattr(batcher, method)(*args)
+    batcher.close()
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--events', type = 'int', default = 1000, help = 'usage events to record')
+    parser.add_option('--customers', type = 'int', default = 10, help = 'customers the events are spread over')
+    parser.add_option('--latency', type = 'float', default = 0.02, help = 'seconds of simulated latency per request')
+    options, args = parser.parse_args()
+
+    server = FakeCheddarGetter(latency = options.latency)
+    server.populate(customers = options.customers, invoices = 1)
+    CheddarGetter.set_server(server.start())
+    CheddarGetter.set_product_code(server.product_code)
+    usage = events(options.events, options.customers)
+
+    directory = tempfile.mkdtemp()
+    try:
+        for name, run in (('unbatched', lambda: unbatched(usage)),
+                ('batched', lambda: batched(usage, None)),
+                ('batched + log', lambda: batched(usage, os.path.join(directory, 'usage.log')))):
+            before = sum(server.stats().values())
+            start = time.time()
+            run()
+            print '%-14s %8.3fs %6d requests' % (name, time.time() - start, sum(server.stats().values()) - before)
+    finally:
+        server.stop()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,249 @@
-import copy
 import datetime
-import httplib2
 import re
 import sys
+import threading
+import time
+from bulk import bulk_save
+from cache import IdentityMap, LRUCache
+from coalesce import SingleFlight
+from paging import ParallelPages, date_windows
 from exceptions import *
+from instrumentation import Histogram, RequestEvent
+from pool import ConnectionPool
+from resilience import OUTAGE, TRANSIENT, CircuitBreaker, RetryPolicy
+from sync import CREATE, UPDATE, DELETE, Delta
+from unitofwork import UnitOfWork
+from usage import UsageBatcher
 from utils import *
-from xml.etree import ElementTree
-from urllib import urlencode
+import endpoints
+import xmlbackend
 
 VERSION = '0.9.3'
 
-class CheddarGetter:
-    """Class designed to handle all interaction with the CheddarGetter API."""
+# the kinds of entries in a CheddarObject decoder table
+FIELD = 'field'
+SINGLE = 'single'
+MANY = 'many'
+
+# CheddarObject passes these through to its data dictionary
+_dict_methods = frozenset(dir(dict))
+
+class _clientmethod(object):
+    """A CheddarGetter method that may be called on a client, or on the
+    CheddarGetter class itself, in which case the default client is used."""
     
-    _server = 'https://cheddargetter.com'
-    _http = httplib2.Http()
-    _product_code = None
     
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
         
-    @classmethod
-    def auth(cls, username, password):
+        
+    def __get__(self, client, cls):
+        if client is None:
+            client = cls._default
+        return self.func.__get__(client, cls)
+        
+
+class CheddarGetter(object):
+    """Class designed to handle all interaction with the CheddarGetter API.
+    
+    Each CheddarGetter is a client with its own credentials, product code,
+    connection pool and caches, and its own copies of the model classes
+    (client.Customer, client.Plan and so on), so several products can be
+    used from one process at once:
+    
+        >>> acme = CheddarGetter('ACME', 'e-mail address', 'password')
+        >>> acme.Customer.get('MY_CODE')
+    
+    Calling a method on the CheddarGetter class itself, such as
+    CheddarGetter.auth(), configures the default client, which the
+    module-level model classes (Customer, Plan and so on) are bound to."""
+    
+    # the model classes each client gets its own copy of
+    _models = ('Plan', 'Customer', 'Subscription', 'Item', 'Invoice', 'Charge')
+    
+    
+    def __init__(self, product_code = None, username = None, password = None, server = 'https://cheddargetter.com', pool_size = 10):
+        """Create a client for the given product. Credentials may
+        also be set later with auth()."""
+        
+        self._server = server.rstrip('/')
+        self._pool = ConnectionPool(pool_size)
+        self._product_code = product_code
+        self._observers = []
+        
+        # reads are safe to retry; nothing else is retried unless asked
+        self._retry_policies = {
+            'plans/get': RetryPolicy(),
+            'customers/get': RetryPolicy(),
+        }
+        self._breaker = CircuitBreaker()
+        self._breakers = {}
+        
+        # concurrent identical reads share one request
+        self._coalesced = frozenset(['plans/get', 'customers/get'])
+        self._flights = SingleFlight()
+        
+        # the units of work open in each thread
+        self._local = threading.local()
+        
+        if username is not None:
+            self.auth(username, password)
+            
+        # bind a copy of each model class to this client
+        module = sys.modules[__name__]
+        for name in self._models:
+            setattr(self, name, getattr(module, name)._bind(self))
+        
+        
+    @_clientmethod
+    def auth(self, username, password):
         """Define the settings used to connect to CheddarGetter."""
         
-        # add the credentials to the HTTP connection
-        cls._http.add_credentials(username, password)
+        # add the credentials to the HTTP connections
+        self._pool.add_credentials(username, password)
         
     
-    @classmethod
-    def set_product_code(cls, product_code):
-        # define the product code in the class
-        cls._product_code = product_code
+    @_clientmethod
+    def set_pool_size(self, size):
+        """Set the maximum number of simultaneous connections to CheddarGetter."""
         
+        self._pool.resize(size)
         
-    @classmethod
-    def request(cls, path, code = None, item_code = None, product_code = None, pass_product_code = True, **kwargs):
+    
+    @_clientmethod
+    def pool_stats(self):
+        """Return a dictionary describing the connection pool: its size
+        and the number of connections in use and idle, as well as how many
+        requests have had to wait for a connection."""
+        
+        return self._pool.stats()
+        
+    
+    @_clientmethod
+    def add_observer(self, observer):
+        """Register a callable to be called with a RequestEvent
+        (see pycheddar.instrumentation) after every request."""
+        
+        # replace the list rather than changing it, so that requests
+        # in other threads can keep iterating over the old one
+        self._observers = self._observers + [observer]
+        
+        
+    @_clientmethod
+    def remove_observer(self, observer):
+        """Stop calling a callable registered with CheddarGetter.add_observer()."""
+        
+        self._observers = [i for i in self._observers if i is not observer]
+        
+        
+    @_clientmethod
+    def set_retry_policy(self, endpoint, policy):
+        """Set the RetryPolicy (see pycheddar.resilience) for an endpoint,
+        such as "customers/get". Pass None to turn retries off.
+        
+        Only requests that are safe to repeat should be retried; by default,
+        that is "plans/get" and "customers/get"."""
+        
+        policies = dict(self._retry_policies)
+        policies[endpoint] = policy
+        self._retry_policies = policies
+        
+        
+    @_clientmethod
+    def set_circuit_breaker(self, breaker, endpoint = None):
+        """Set the CircuitBreaker (see pycheddar.resilience) for an endpoint,
+        or the default breaker shared by every other endpoint if no
+        endpoint is given. Pass None to turn the breaker off."""
+        
+        if endpoint is None:
+            self._breaker = breaker
+        else:
+            breakers = dict(self._breakers)
+            breakers[endpoint] = breaker
+            self._breakers = breakers
+            
+            
+    @_clientmethod
+    def breaker_stats(self):
+        """Return the state of every circuit breaker, keyed by endpoint
+        (the default breaker is under None)."""
+        
+        stats = {}
+        if self._breaker is not None:
+            stats[None] = self._breaker.stats()
+        for endpoint, breaker in self._breakers.items():
+            if breaker is not None:
+                stats[endpoint] = breaker.stats()
+        return stats
+        
+        
+    @_clientmethod
+    def set_coalesced_endpoints(self, endpoints):
+        """Set the endpoints (such as "customers/get") for which concurrent
+        identical requests share a single HTTP request and its result.
+        Only reads should be coalesced; by default, that is "plans/get"
+        and "customers/get". Pass an empty list to turn coalescing off."""
+        
+        self._coalesced = frozenset(endpoints)
+        
+        
+    @_clientmethod
+    def coalescing_stats(self):
+        """Return the number of coalesced requests actually sent, and the
+        number of requests that shared one of them instead."""
+        
+        return self._flights.stats()
+        
+        
+    @_clientmethod
+    def unit_of_work(self):
+        """Return a UnitOfWork (see pycheddar.unitofwork): while it is
+        open, saves of customers and subscriptions are put off and then
+        merged into as few requests as possible."""
+        
+        return UnitOfWork(self)
+        
+        
+    @_clientmethod
+    def batch_usage(self, max_size = 1000, max_delay = 5.0, log = None, sync = False, on_error = None):
+        """Return a UsageBatcher (see pycheddar.usage), which merges
+        charges and item quantity changes and sends them in batches
+        from a background thread."""
+        
+        return UsageBatcher(self, max_size = max_size, max_delay = max_delay, log = log, sync = sync, on_error = on_error)
+        
+        
+    @_clientmethod
+    def _defer(self, obj):
+        """Add an object to the unit of work open in this thread, if
+        there is one, and return True; return False otherwise.
+        
+        This method should be considered opaque."""
+        
+        units = getattr(self._local, 'units', None)
+        if not units:
+            return False
+        units[0].add(obj)
+        return True
+        
+        
+    @_clientmethod
+    def set_server(self, server):
+        """Set the CheddarGetter server to send requests to, such as a
+        pycheddar.fakeserver.FakeCheddarGetter for benchmarks and tests."""
+        
+        self._server = server.rstrip('/')
+        
+        
+    @_clientmethod
+    def set_product_code(self, product_code):
+        # define the product code for this client
+        self._product_code = product_code
+        
+        
+    @_clientmethod
+    def request(self, path, code = None, item_code = None, product_code = None, pass_product_code = True, **kwargs):
         """Process an arbitrary request to CheddarGetter.
         
         Ordinarily, you shouldn't have to call this method directly,
@@ -43,71 +253,261 @@ class CheddarGetter:
         and does not need to be included. Override this behavior by passing
         pass_product_code = False."""
 
-        # build the base request URL
-        url = '%s/xml/%s' % (cls._server, path.strip('/'))
-
-        # if a code was requested, I may be sent an ID instead; detect this
-        # and change the key accordingly
-        if code is not None:
-            add_to_url = True
-            if path.strip('/')[-3:] == 'new':
-                add_to_url = False
+        # only keep track of what happens if someone is listening
+        event = None
+        if self._observers:
+            event = RequestEvent(path)
+            
+        try:
+            # build the URL and POST body
+            url, body = self._build_url(path, code = code, item_code = item_code, product_code = product_code, pass_product_code = pass_product_code, **kwargs)
+            
+            # send the request, parse the XML and raise appropriate
+            # exceptions if there is an error of any kind
+            def send():
+                response, content = self._send(url, body, event)
+                content = self._parse(content, event)
+                self._check_response(response, content)
+                return content
                 
-            # make sure code is a string
-            code = str(code)
+            # return the processed content from CheddarGetter
+            return self._coalesce(path, url, body, send, event)
+        except Exception, e:
+            if event is not None:
+                event.exception = e.__class__.__name__
+            raise
+        finally:
+            if event is not None:
+                self._notify(event)
+        
+        
+    @_clientmethod
+    def iterrequest(self, path, tag, **kwargs):
+        """Process a request to CheddarGetter, yielding each top-level
+        element with the given tag as soon as it has been parsed.
+        
+        Takes the same arguments as CheddarGetter.request. Each element
+        is cleared once the consumer moves on to the next one, so the full
+        element tree is never held in memory at once."""
+        
+        # only keep track of what happens if someone is listening; parsing
+        # is interleaved with the caller's work here, so it isn't timed
+        event = None
+        if self._observers:
+            event = RequestEvent(path)
             
-            # it may be an ID instead; detect this
-            if re.match(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', code):
-                if add_to_url is True:
-                    url += '/id/' + code
-                else:
+        try:
+            # send the request exactly as CheddarGetter.request would;
+            # error responses are small, so parse them in one shot
+            # and raise the appropriate exception
+            url, body = self._build_url(path, **kwargs)
+            def send():
+                response, content = self._send(url, body, event)
+                if int(response['status']) >= 400:
+                    self._check_response(response, self._parse(content))
+                return response, content
+                
+            response, content = self._coalesce(path, url, body, send, event, 'iter')
+            
+            # walk the response incrementally, keeping track of depth so that
+            # only direct children of the root element are yielded
+            # (customers contain nested plans, for instance)
+            depth = 0
+            root = None
+            try:
+                for action, element in xmlbackend.backend.iterparse(content, ('start', 'end')):
+                    if action == 'start':
+                        depth += 1
+                        if root is None:
+                            root = element
+                        continue
+                    
+                    depth -= 1
+                    if depth != 1 or root.tag == 'error':
+                        continue
+                    
+                    if element.tag == tag:
+                        yield element
+                        
+                    # done with this element; throw it away
+                    root.clear()
+            except SyntaxError:
+                raise UnexpectedResponse, "The server sent back something that wasn't valid XML."
+            
+            # CheddarGetter may also send an error with a successful status;
+            # it has been fully parsed at this point
+            if root is not None and root.tag == 'error':
+                self._check_response(response, root)
+        except Exception, e:
+            if event is not None:
+                event.exception = e.__class__.__name__
+            raise
+        finally:
+            if event is not None:
+                self._notify(event)
+        
+        
+    @_clientmethod
+    def _build_url(self, path, code = None, item_code = None, product_code = None, pass_product_code = True, **kwargs):
+        """Build the request URL and urlencoded POST body for a request to
+        CheddarGetter, using the compiled endpoint for the path (see
+        pycheddar.endpoints). Return a (url, body) tuple.
+        
+        This method should be considered opaque."""
+        
+        endpoint = endpoints.endpoint(path)
+        
+        # if a code was requested, I may be sent an ID instead; the
+        # endpoint puts either in the URL, but a new object's code
+        # goes in the POST body
+        if code is not None:
+            code = str(code)
+            if endpoint.creates:
+                if endpoints.is_id(code):
                     raise ValueError, 'Cannot send an ID for an object creation request.'
-            else:
-                if add_to_url is True:
-                    url += '/code/' + code
-                else:
-                    kwargs['code'] = code
+                kwargs['code'] = code
                     
-        # item_code is also handled differently from other keyword arguments
-        # (CheddarGetter expects it in the URL, not the POST body)
-        if item_code is not None:
-            url += '/itemCode/' + item_code
-                
-        # mangle the kwargs to make them match what
-        # CheddarGetter expects
-        for key in copy.copy(kwargs):
-            # move from Python naming conventions to Zend Framework conventions
-            # (read: underscores become camel-case)
-            if '_' in key:
-                kwargs[to_camel_case(key)] = kwargs[key]
-                del kwargs[key]
-                                    
         # add in the product code
         if pass_product_code is True:
-            # if the product code is None, use the one assigned to the class generically
+            # if the product code is None, use the one assigned to the client generically
             if product_code is None:
-                product_code = cls._product_code
+                product_code = self._product_code
             
             # sanity check: is the product code set?
             if not product_code:
                 raise AttributeError, 'You must set a CheddarGetter product code. Use CheddarGetter.set_product_code(product_code).'
+        else:
+            product_code = None
+            
+        return endpoint.url(self._server, code, item_code, product_code), endpoint.encode(kwargs)
+        
+        
+    @_clientmethod
+    def _coalesce(self, path, url, body, send, event = None, mode = 'parse'):
+        """Send the request through self._attempt(), unless the endpoint is
+        a read and an identical request is already in flight, in which case
+        wait for that request and share its result.
+        
+        Requests only share results with requests of the same mode, since
+        request() and iterrequest() get different results from send().
+        
+        This method should be considered opaque."""
+        
+        if to_endpoint(path) not in self._coalesced:
+            return self._attempt(path, send, event)
             
-            url += '/productCode/' + product_code + '/'
+        key = mode + ':' + url + '?' + body
+        return self._flights.do(key, lambda: self._attempt(path, send, event))
+        
+        
+    @_clientmethod
+    def _attempt(self, path, send, event = None):
+        """Call send() and return its result, subject to the retry policy and
+        circuit breaker for the endpoint.
+        
+        This method should be considered opaque."""
+        
+        endpoint = to_endpoint(path)
+        policy = self._retry_policies.get(endpoint)
+        breaker = self._breakers.get(endpoint, self._breaker)
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_request()
+            if event is not None:
+                event.attempts += 1
+                
+            try:
+                result = send()
+            except TRANSIENT, e:
+                # the breaker only counts requests that fail for good, and
+                # only if CheddarGetter couldn't be reached at all
+                if policy is None or attempt >= policy.retries:
+                    if breaker is not None:
+                        if isinstance(e, OUTAGE):
+                            breaker.record_failure()
+                        else:
+                            breaker.record_success()
+                    raise
+                time.sleep(policy.delay(attempt))
+                attempt += 1
+                continue
+            except Exception:
+                # CheddarGetter answered; the request itself was the problem
+                if breaker is not None:
+                    breaker.record_success()
+                raise
+                
+            if breaker is not None:
+                breaker.record_success()
+            return result
+        
+        
+    @_clientmethod
+    def _send(self, url, body, event = None):
+        """Send a POST request to CheddarGetter and return the
+        (response, content) tuple, recording sizes and timing
+        in the RequestEvent if one is given.
+        
+        This method should be considered opaque."""
+        
+        if event is None:
+            return self._pool.request(url, method = 'POST', body = body, headers = {
+                'content-type': 'application/x-www-form-urlencoded'
+            })
             
-        # create the curl command
-        request, content = cls._http.request(url, method = 'POST', body = urlencode(kwargs), headers = {
+        event.bytes_out = len(body)
+        start = time.time()
+        response, content = self._pool.request(url, method = 'POST', body = body, headers = {
             'content-type': 'application/x-www-form-urlencoded'
         })
+        event.network_time = time.time() - start
+        event.status = int(response['status'])
+        event.bytes_in = len(content)
+        return response, content
+        
+        
+    @_clientmethod
+    def _parse(self, content, event = None):
+        """Parse the raw XML sent back from CheddarGetter with the XML backend
+        in use (see pycheddar.xmlbackend), recording the time taken in the
+        RequestEvent if one is given.
+        
+        This method should be considered opaque."""
         
-        # parse the XML
+        start = time.time()
         try:
-            content = ElementTree.fromstring(content)
-        except:
+            return xmlbackend.backend.fromstring(content)
+        except SyntaxError:
             raise UnexpectedResponse, "The server sent back something that wasn't valid XML."
+        finally:
+            if event is not None:
+                event.parse_time = time.time() - start
         
-        # raise appropriate exceptions if there is an error
-        # of any kind
-        status = int(request['status'])
+        
+    @_clientmethod
+    def _notify(self, event):
+        """Finish a RequestEvent and hand it to every observer.
+        
+        This method should be considered opaque."""
+        
+        event.total_time = time.time() - event.started
+        for observer in self._observers:
+            # a broken metrics exporter must never break billing
+            try:
+                observer(event)
+            except Exception:
+                pass
+        
+        
+    @_clientmethod
+    def _check_response(self, response, content):
+        """Raise the appropriate exception if CheddarGetter
+        responded with an error of any kind.
+        
+        This method should be considered opaque."""
+        
+        status = int(response['status'])
         if status >= 400 or content.tag == 'error':
             if status == 404:
                 raise NotFound, content.text
@@ -123,25 +523,128 @@ class CheddarGetter:
                 raise GatewayConnectionError, content.text
             else:
                 raise UnexpectedResponse, content.text
-            
-        # return the processed content from CheddarGetter
-        return content
                     
 
+class _Deferred(object):
+    """A list of child objects that has not been decoded yet: the
+    class of the children, and the XML element they will be built from."""
+    
+    __slots__ = ('klass', 'xml')
+    
+    
+    def __init__(self, klass, xml):
+        self.klass = klass
+        self.xml = xml
+        
+
+class _Field(object):
+    """The generated accessor for a field in a class's schema: reading it
+    takes the value straight from self._data, falling back on __getattr__
+    for anything out of the ordinary (such as a field that wasn't sent)."""
+    
+    __slots__ = ('key',)
+    
+    
+    def __init__(self, key):
+        self.key = key
+        
+        
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            value = obj._data[self.key]
+        except KeyError:
+            return obj.__getattr__(self.key)
+            
+        # related objects take precedence, as they do in __getattr__
+        if self.key in obj._relations:
+            return obj.__getattr__(self.key)
+        return value
+        
+        
+class _Relation(object):
+    """The generated accessor for a child object (or list of child
+    objects) in a class's schema: reading it takes it straight from
+    self._relations, decoding it first if it was loaded lazily."""
+    
+    __slots__ = ('key',)
+    
+    
+    def __init__(self, key):
+        self.key = key
+        
+        
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            value = obj._relations[self.key]
+        except KeyError:
+            return obj.__getattr__(self.key)
+        if value.__class__ is _Deferred:
+            return obj._hydrate(self.key, value)
+        return value
+        
+
 class CheddarObject(object):
     """A object that can represent most objects that come down
-    from CheddarGetter."""
+    from CheddarGetter.
+    
+    Instances have no __dict__: the fixed attributes live in slots, field
+    values in self._data, and related objects (children, lists of children
+    and the parent) in self._relations. Rather than keeping a second, clean
+    copy of self._data, each field has a bit in the self._dirty bitmask
+    which is set whenever the field is changed locally.
+    
+    In lazy mode (see set_lazy_loading), lists of child objects such as
+    invoices, charges and items are kept as their XML until they are
+    first read, so that loading a customer only to look at its email
+    address doesn't pay for years of invoices.
+    
+    Reading a field or child object described by a class's schema goes
+    through an accessor generated for the class (see _compile_accessors)
+    rather than through __getattr__, which handles everything else."""
+    
+    __slots__ = ('_product_code', '_data', '_dirty', '_relations', '_id', '_code', '_cursor', '__weakref__')
+    
+    # the schema for this kind of object: the fields CheddarGetter sends,
+    # in underscored form, with the function that converts each from XML,
+    # and the (tag, class name, SINGLE or MANY) relationships to child objects;
+    # fields are assigned the low bits of the dirty bitmask, and any
+    # other field is assigned the next free bit the first time it is seen
+    _fields = ()
+    _children = ()
+    _bits_lock = threading.Lock()
+    _lazy = False
+    
+    # held while a refreshed object's state is swapped in (see _refresh)
+    _refresh_lock = threading.Lock()
+    
+    # nothing is cached unless a class sets a cache (see set_cache)
+    _cache = None
+    
+    # objects aren't tracked by ID unless a class sets an identity
+    # map (see set_identity_map)
+    _identity = None
+    
+    # the CheddarGetter client this class is bound to; the classes
+    # in this module are bound to the default client
+    _client = None
     
     
     def __init__(self, parent = None, **kwargs):
         """Instantiate the object."""
         
-        self._product_code = CheddarGetter._product_code
-        self._data = {}
-        self._clean_data = {}
-        self._id = None
-        self._code = None
-        self._cursor = 0
+        # set the slots directly; there's no need to go through self.__setattr__
+        set_slot = object.__setattr__
+        set_slot(self, '_product_code', self._client._product_code)
+        set_slot(self, '_data', {})
+        set_slot(self, '_dirty', 0)
+        set_slot(self, '_relations', {})
+        set_slot(self, '_id', None)
+        set_slot(self, '_code', None)
+        set_slot(self, '_cursor', 0)
         
         # is this object a child of some other object?
         # note the relationship if it's sent
@@ -157,10 +660,13 @@ class CheddarObject(object):
     def __setattr__(self, key, value):
         """Set an arbitrary attribute on this object."""
         
-        # if this item is private, set the instance's
-        # attribute dictionary directly
+        # if this item is private, set the slot directly if there is one;
+        # otherwise it's a private relation (such as a clean copy of a child)
         if key[0] == '_':
-            self.__dict__[key] = value
+            if key in CheddarObject.__slots__:
+                object.__setattr__(self, key, value)
+            else:
+                self._relations[key] = value
         elif key == 'code':
             # code can only be modified if the id is not set
             if self._id is None:
@@ -172,31 +678,38 @@ class CheddarObject(object):
             raise AttributeError, 'The CheddarGetter ID is immutable.'
         elif isinstance(value, CheddarObject) or isinstance(value, list):
             # if the value is a CheddarObject or a list, then it doesn't belong
-            # as part of the data dictionary, but rather as a regular
-            # instance attribute
-            self.__dict__[key] = value
+            # as part of the data dictionary, but rather as a relation
+            self._relations[key] = value
         else:
             # in normal situations, write this item to the
-            # self._data dictionary (using underscores, always)
-            self._data[to_underscores(key)] = value
+            # self._data dictionary (using underscores, always),
+            # and note that it is dirty if the value changed
+            key = to_underscores(key)
+            if key not in self._data or self._data[key] != value:
+                self._dirty |= self._bit(key)
+            self._data[key] = value
         
         
     def __getattr__(self, key):
         """Return an arbitrary attribute on this object."""
 
+        # a slot that has not been set yet; don't go looking for it
+        if key[0] == '_' and key in CheddarObject.__slots__:
+            raise AttributeError, key
+            
+        # is this a related object? these take precedence over
+        # everything else (a list of items is not self._data.items)
+        if key in self._relations:
+            value = self._relations[key]
+            if value.__class__ is _Deferred:
+                value = self._hydrate(key, value)
+            return value
+            
         # is this a dict method? if so, use the self._data
         # method
-        if hasattr(self._data, key):
+        if key in _dict_methods:
             return getattr(self._data, key)
-        
-        # handle the id and code in a special way
-        if key == 'id' or key == 'code':
-            return self.__dict__['_' + key]
 
-        # is this in the regular attribute dictionary?
-        if key[0] == '_' or key in self.__dict__:
-            return self.__dict__[key]
-            
         # retrieve from the self._data dictionary
         if key in self._data:
             return self._data[to_underscores(key)]
@@ -204,6 +717,273 @@ class CheddarObject(object):
         raise AttributeError, 'Key "%s" does not exist.' % key
         
         
+    def _hydrate(self, key, deferred):
+        """Decode a list of child objects that was loaded lazily,
+        and put it in place of the deferred list.
+        
+        This method should be considered opaque."""
+        
+        children = [deferred.klass.from_xml(indiv_xml, parent = self, lazy = True) for indiv_xml in deferred.xml]
+        
+        # the list and its clean version were deferred together, and
+        # are still the same list unless one of them has been replaced
+        if key.startswith('_clean_'):
+            key = key[7:]
+        relations = self._relations
+        for name in (key, '_clean_' + key):
+            if relations.get(name) is deferred:
+                relations[name] = children
+        return children
+        
+        
+    @property
+    def id(self):
+        """The CheddarGetter ID, or None if this is new."""
+        
+        return self._id
+        
+        
+    @property
+    def code(self):
+        """The code of this object."""
+        
+        return self._code
+        
+        
+    @classmethod
+    def _compile_accessors(cls):
+        """Generate an accessor for each field and child object in this
+        class's schema. Names the class already defines are left alone, as
+        are fields named after dict methods, which __getattr__ gives
+        precedence to. Classes bound to a client inherit the accessors.
+        
+        This method should be considered opaque."""
+        
+        for key, convert in cls._fields:
+            if not hasattr(cls, key) and key not in _dict_methods:
+                setattr(cls, key, _Field(key))
+        
+        # a single child is kept under its own tag (a customer's
+        # <subscriptions> holds a <subscription>), a list under the list's
+        for tag, class_name, kind in cls._children:
+            if kind is SINGLE:
+                tag = class_name.lower()
+            if not hasattr(cls, tag):
+                setattr(cls, tag, _Relation(tag))
+        
+        
+    @classmethod
+    def _bind(cls, client):
+        """Return a copy of this class bound to the given client, with
+        no cache or identity map, so that it shares neither with the
+        class it was copied from.
+        
+        This method should be considered opaque."""
+        
+        return type(cls.__name__, (cls,), {
+            '__slots__': (),
+            '__module__': cls.__module__,
+            '_client': client,
+            '_cache': None,
+            '_identity': None,
+        })
+        
+        
+    @classmethod
+    def set_cache(cls, cache):
+        """Set the cache kept in front of the get() and all() methods of
+        this class. This may be any pycheddar.cache.Cache, such as an
+        LRUCache, or a SQLiteCache to keep it across runs; pass None
+        to disable caching.
+        
+        Each client has its own caches; to set one for a client other
+        than the default one, use client.Customer.set_cache()."""
+        
+        cls._cache = cache
+        
+        
+    @classmethod
+    def clear_cache(cls):
+        """Remove everything from the cache."""
+        
+        if cls._cache is not None:
+            cls._cache.clear()
+            
+            
+    @classmethod
+    def cache_stats(cls):
+        """Return a dictionary with the hit and miss counts of the cache."""
+        
+        if cls._cache is None:
+            return {}
+        return cls._cache.stats()
+        
+        
+    @classmethod
+    def _cache_key(cls, code):
+        """Return the cache key for the given code or ID (or "*" for
+        everything) within the current product.
+        
+        This method should be considered opaque."""
+        
+        return 'pycheddar:%s:%s:%s' % (cls.__name__.lower(), cls._client._product_code, code)
+        
+        
+    @classmethod
+    def _cache_get(cls, code):
+        """Return the cached XML for the given code or ID,
+        or None if it is not cached.
+        
+        This method should be considered opaque."""
+        
+        if cls._cache is None:
+            return None
+        return cls._cache.get(cls._cache_key(code))
+        
+        
+    @classmethod
+    def _cache_set(cls, xml, pending = None, value = None):
+        """Store the XML for an object in the cache, under both its code
+        and its ID. If a pending list is given, the entries are added to
+        it instead, so that they can all be stored at once with set_many().
+        Pass the XML as a string in value if it has already been serialized.
+        
+        This method should be considered opaque."""
+        
+        # serializing the XML costs about as much as decoding it,
+        # so don't bother when there is nowhere to put it
+        if cls._cache is None:
+            return
+        if value is None:
+            value = xmlbackend.backend.tostring(xml)
+        entries = [(cls._cache_key(code), value) for code in (xml.get('code'), xml.get('id')) if code is not None]
+        if pending is not None:
+            pending.extend(entries)
+        else:
+            cls._cache.set_many(entries)
+        
+        
+    def _cache_invalidate(self):
+        """Remove this object from the cache, along with the cached list
+        of every object of its kind, after it has been changed.
+        
+        This method should be considered opaque."""
+        
+        self._cache_forget(self._code, self._id)
+        
+        
+    @classmethod
+    def _cache_forget(cls, *codes):
+        """Remove the objects with the given codes or IDs from the cache,
+        along with the cached list of every object of this kind. Objects
+        are cached under both their code and their ID, so given either
+        one, the other is looked up in the cached XML and removed too.
+        
+        This method should be considered opaque."""
+        
+        cache = cls._cache
+        if cache is None:
+            return
+            
+        keys = set([cls._cache_key('*')])
+        for code in codes:
+            if code is None:
+                continue
+            key = cls._cache_key(code)
+            keys.add(key)
+            
+            # only the root element's attributes are needed
+            value = cache._get(key)
+            if value is not None:
+                for action, element in xmlbackend.backend.iterparse(value, ('start',)):
+                    for name in ('code', 'id'):
+                        if element.get(name) is not None:
+                            keys.add(cls._cache_key(element.get(name)))
+                    break
+                    
+        for key in keys:
+            cache.delete(key)
+        
+        
+    @classmethod
+    def set_identity_map(cls, enabled = True):
+        """Turn the identity map for this class on or off. While it is on,
+        loading an object that is already in memory (getting the same
+        customer twice, or getting a customer that is also in a search
+        result) refreshes that object in place instead of creating a second
+        one, so there is only ever one object for each ID. Unsaved changes
+        to the object are lost when it is refreshed.
+        
+        Each client has its own identity maps; to turn one on for a client
+        other than the default one, use client.Customer.set_identity_map()."""
+        
+        cls._identity = IdentityMap() if enabled else None
+        
+        
+    @classmethod
+    def identity_stats(cls):
+        """Return a dictionary with the hit and miss counts of the identity
+        map, and the number of objects it is keeping track of."""
+        
+        if cls._identity is None:
+            return {}
+        return cls._identity.stats()
+        
+        
+    @classmethod
+    def set_lazy_loading(cls, lazy = True):
+        """Turn lazy loading of lists of child objects (invoices,
+        charges, items and so on) on or off for every object
+        loaded from now on."""
+        
+        CheddarObject._lazy = lazy
+        
+        
+    @classmethod
+    def _bit(cls, key):
+        """Return the dirty bitmask bit for the given (underscored) field.
+        
+        This method should be considered opaque."""
+        
+        # each class has its own field -> bit table, built from
+        # the class's fields the first time it is needed
+        bits = cls.__dict__.get('_bits')
+        if bits is None or key not in bits:
+            cls._bits_lock.acquire()
+            try:
+                if '_bits' not in cls.__dict__:
+                    cls._bits = {}
+                    cls._bit_names = []
+                    for field, convert in cls._fields:
+                        cls._bits[field] = 1 << len(cls._bit_names)
+                        cls._bit_names.append(field)
+                if key not in cls._bits:
+                    cls._bits[key] = 1 << len(cls._bit_names)
+                    cls._bit_names.append(key)
+                bits = cls._bits
+            finally:
+                cls._bits_lock.release()
+                
+        return bits[key]
+        
+        
+    def _dirty_keys(self):
+        """Return the list of fields that have been changed locally.
+        
+        This method should be considered opaque."""
+        
+        keys = []
+        dirty = self._dirty
+        index = 0
+        while dirty:
+            if dirty & 1:
+                keys.append(self._bit_names[index])
+            dirty >>= 1
+            index += 1
+            
+        return keys
+        
+        
     def __eq__(self, other):
         """Return True if these objects have equal _id properties, False otherwise."""
         
@@ -256,98 +1036,213 @@ class CheddarObject(object):
         Data loaded through this method is assumed to be clean.
         If it is dirty data (in other words, data that does not
         match what is currently saved in CheddarGetter), set kwarg
-        clean = False."""
+        clean = False.
+        
+        Lists of child objects are decoded when first read if kwarg
+        lazy = True, and straight away if lazy = False; the default
+        is set by CheddarObject.set_lazy_loading()."""
         
         # default "clean" to True and "parent" to None
         clean = kwargs.pop('clean', True)
         parent = kwargs.pop('parent', None)
+        lazy = kwargs.pop('lazy', None)
         
         # I don't recognize any other kwargs
         if len(kwargs) > 0:
             raise KeyError, 'Unrecognized keyword argument: %s' % kwargs.keys()[0]
         
+        # if this object is already in memory, refresh it
+        # rather than creating another
+        if cls._identity is not None:
+            key = xml.get('id')
+            if key is not None:
+                new = cls._identity.get(key)
+                if new is not None:
+                    new._refresh(xml, parent, clean, lazy)
+                    return new
+        
         # create the new object and load in the data
         new = cls(parent = parent, **kwargs)
-        new._load_data_from_xml(xml, clean)
+        new._load_data_from_xml(xml, clean, lazy)
+        new._identify()
         
         # done -- return the new object
         return new
         
         
-    def _load_data_from_xml(self, xml, clean = True):
+    def _identify(self):
+        """Keep track of this object by ID, if this class has an
+        identity map and the object has an ID.
+        
+        This method should be considered opaque."""
+        
+        if self._identity is not None and self._id is not None:
+            self._identity.add(self._id, self)
+        
+        
+    def _refresh(self, xml, parent, clean, lazy):
+        """Throw away everything this object holds, and load it
+        again from XML retrieved from CheddarGetter.
+        
+        The object may be in use by other threads (it is in the identity
+        map), so the XML is decoded into new dictionaries, which then
+        replace the old ones; nobody sees the object half loaded.
+        
+        This method should be considered opaque."""
+        
+        data = {}
+        relations = {}
+        if parent is not None:
+            relations[parent.__class__.__name__.lower()] = parent
+        dirty = self._decode_xml(xml, data, relations, 0, clean, lazy)
+        
+        set_slot = object.__setattr__
+        self._refresh_lock.acquire()
+        try:
+            set_slot(self, '_data', data)
+            set_slot(self, '_relations', relations)
+            set_slot(self, '_dirty', dirty)
+            set_slot(self, '_cursor', 0)
+            set_slot(self, '_code', xml.get('code'))
+        finally:
+            self._refresh_lock.release()
+        
+        
+    def _load_data_from_xml(self, xml, clean = True, lazy = None):
         """Load information for this object based on XML retrieved
         from CheddarGetter.
         
         Data loaded through this method is assumed to be clean.
         If it is dirty data (in other words, data that does not
         match what is currently saved in CheddarGetter), set
-        clean = False.
+        clean = False. Lists of child objects are left as XML
+        until first read if lazy = True (None means the default).
         
         This method should be considered opaque."""
         
         self._id = xml.get('id')
         self._code = xml.get('code')
+        self._dirty = self._decode_xml(xml, self._data, self._relations, self._dirty, clean, lazy)
         
-        # denote relationships where there will only
-        # be one child object, rather than an arbitrary set
-        singles = (
-            ('customer', 'subscriptions'),
-            ('subscription', 'plans'),
-        )
-        
-        for child in xml.getchildren():
-            # is this an element with children? if so, it's an object
-            # relationship, not just an attribute
-            if len(child.getchildren()) > 0:
-                # is this a single-esque relationship, as opposed to one
-                # where the object should contain a list?
-                if (xml.tag, child.tag) in singles:
-                    single_xml = child.getchildren()[0]
-                    class_name = single_xml.tag.capitalize()
-                    
-                    if hasattr(sys.modules[__name__], class_name):
-                        klass = getattr(sys.modules[__name__], single_xml.tag.capitalize())
-                        setattr(self, single_xml.tag, klass.from_xml(single_xml, parent = self))
-                        
-                        # denote a clean version as well
-                        setattr(self, '_clean_%s' % single_xml.tag, getattr(self, single_xml.tag))
-                        
-                    continue
-                    
-                # okay, it's not a single relationship -- follow my normal
-                # process for a many to many
-                setattr(self, child.tag, [])
-                for indiv_xml in child.getchildren():
-                    # get the class that this item is
-                    try:
-                        klass = getattr(sys.modules[__name__], indiv_xml.tag.capitalize())
-                    
-                        # the XML underneath here constitutes the necessary
-                        # XML to generate that object; call its XML function
-                        getattr(self, child.tag).append(klass.from_xml(indiv_xml, parent = self))
-                    except AttributeError:
-                        break
-                        
-                    # set the clean version
-                    setattr(self, '_clean_' + child.tag, getattr(self, child.tag))
-                        
-                # done; move to the next child
+        
+    def _decode_xml(self, xml, data, relations, dirty, clean, lazy):
+        """Decode the fields and child objects in this object's XML into
+        the given data and relations dictionaries, and return the dirty
+        bitmask, updated from the given one.
+        
+        This method should be considered opaque."""
+        
+        if lazy is None:
+            lazy = self._lazy
+        
+        # each child element is handled by a single lookup in this
+        # class's decoder table
+        decoders = self._decoders()
+        for child in xml:
+            decoder = decoders.get(child.tag)
+            if decoder is None:
+                dirty = self._load_unknown_xml(child, clean, data, relations, dirty)
                 continue
             
-            # get the element value -- if it's numeric, convert it
-            value = child.text
-            if value is not None:
-                if re.match(r'^[\d]+$', value):
-                    value = int(value)
-                elif re.match(r'^[\d.]+$', value):
-                    value = float(value)
+            kind, key, convert, bit = decoder
+            if kind is FIELD:
+                # get the element value, converted to the field's type,
+                # and note whether it is clean
+                value = child.text
+                if value is not None:
+                    value = convert(value)
+                data[key] = value
+                if clean is not True:
+                    dirty |= bit
+                elif dirty & bit:
+                    dirty &= ~bit
+            elif kind is SINGLE:
+                # a relationship where there will only be one child object,
+                # rather than an arbitrary set; denote a clean version as well
+                if len(child) > 0:
+                    single_xml = child[0]
+                    single = convert._decode_single(single_xml, self, lazy)
+                    relations[single_xml.tag] = single
+                    relations['_clean_' + single_xml.tag] = single
+            else:
+                # a relationship with an arbitrary set of child objects;
+                # in lazy mode, hold on to the XML and decode it when first read
+                if lazy:
+                    children = _Deferred(convert, child)
+                else:
+                    children = [convert.from_xml(indiv_xml, parent = self, lazy = lazy) for indiv_xml in child]
+                relations[key] = children
+                relations['_clean_' + key] = children
                 
-            # set the data dictionaries in my object to
-            # these values
-            key = to_underscores(child.tag)
-            self._data[key] = value
-            if clean is True:
-                self._clean_data[key] = value
+        return dirty
+        
+        
+    @classmethod
+    def _decode_single(cls, xml, parent, lazy):
+        """Decode the one child object of this class that parent has,
+        such as a customer's subscription.
+        
+        This method should be considered opaque."""
+        
+        return cls.from_xml(xml, parent = parent, lazy = lazy)
+        
+        
+    def _load_unknown_xml(self, child, clean, data, relations, dirty):
+        """Load a child element that isn't described by this class's
+        schema, guessing at what it is, into the given data and relations
+        dictionaries. Return the updated dirty bitmask.
+        
+        This method should be considered opaque."""
+        
+        # is this an element with children? if so, it's an object
+        # relationship, not just an attribute
+        if len(child) > 0:
+            # get the class that these items are
+            klass = getattr(self._client, child[0].tag.capitalize(), None)
+            if not isinstance(klass, type) or not issubclass(klass, CheddarObject):
+                relations[child.tag] = []
+                return dirty
+                
+            # the XML underneath here constitutes the necessary
+            # XML to generate those objects
+            children = [klass.from_xml(indiv_xml, parent = self) for indiv_xml in child]
+            relations[child.tag] = children
+            relations['_clean_' + child.tag] = children
+            return dirty
+        
+        # get the element value -- if it's numeric, convert it
+        value = child.text
+        if value is not None:
+            value = guess_type(value)
+            
+        # set the data dictionary in my object to
+        # these values, and note whether they are clean
+        key = to_underscores(child.tag)
+        data[key] = value
+        if clean is True:
+            return dirty & ~self._bit(key)
+        return dirty | self._bit(key)
+        
+        
+    @classmethod
+    def _decoders(cls):
+        """Return this class's decoder table, which maps each XML tag
+        described by the class's schema to a (kind, key, converter, bit) tuple.
+        For relationships, the converter is the child class and there is no bit.
+        
+        This method should be considered opaque."""
+        
+        # the table is compiled from the schema the first time it is needed
+        decoders = cls.__dict__.get('_decoder_table')
+        if decoders is None:
+            decoders = {}
+            for key, convert in cls._fields:
+                decoders[to_camel_case(key)] = (FIELD, key, convert, cls._bit(key))
+            for tag, class_name, kind in cls._children:
+                decoders[tag] = (kind, tag, getattr(cls._client, class_name), 0)
+            cls._decoder_table = decoders
+            
+        return decoders
         
         
     def _build_kwargs(self):
@@ -355,14 +1250,9 @@ class CheddarObject(object):
         modified in the current self._data dictionary."""
         
         kwargs = {}
-        for item in self.iteritems():
-            # if this item is a CheddarObject, then it'll be handled elsewhere
-            if isinstance(item[1], CheddarObject):
-                continue
-            
-            # if this item is dirty, include it in the list of material to send
-            if item[0] not in self._clean_data or item[1] != self._clean_data[item[0]]:
-                kwargs[item[0]] = item[1]
+        for key in self._dirty_keys():
+            if key in self._data:
+                kwargs[key] = self._data[key]
                 
         return kwargs
         
@@ -370,47 +1260,212 @@ class CheddarObject(object):
     def _is_clean(self):
         """Return True if this object has not been modified, False otherwise."""
         
-        if len(self._build_kwargs()) == 0:
+        if self._dirty == 0 or len(self._build_kwargs()) == 0:
             return True
             
         return False
                 
 
 class Plan(CheddarObject):
-    """An object representing a CheddarGetter pricing plan."""
+    """An object representing a CheddarGetter pricing plan.
     
+    A product has a handful of plans, but every subscription loaded from
+    CheddarGetter comes with a copy of its plan. Rather than decoding each
+    copy, subscriptions share a single Plan for each version of a plan
+    (see set_interning). Shared plans, and their items, can't be changed;
+    change the copy unshared() returns instead:
     
+        >>> subscription.plan = subscription.plan.unshared()"""
+    
+    # the XML a shared plan was decoded from, or None if it isn't shared
+    __slots__ = ('_shared',)
+    _fields = (
+        ('name', to_text),
+        ('description', to_text),
+        ('is_active', to_int),
+        ('trial_days', to_int),
+        ('billing_frequency', to_text),
+        ('billing_frequency_per', to_text),
+        ('billing_frequency_unit', to_text),
+        ('billing_frequency_quantity', to_int),
+        ('setup_charge_code', to_text),
+        ('setup_charge_amount', to_decimal),
+        ('recurring_charge_code', to_text),
+        ('recurring_charge_amount', to_decimal),
+        ('created_datetime', to_datetime),
+    )
+    _children = (
+        ('items', 'Item', MANY),
+    )
+    
+    # plans almost never change, so they are cached; replace the
+    # cache with Plan.set_cache(), or pass None to turn caching off
+    _cache = LRUCache()
+    
+    # the plans shared by subscriptions: plan ID -> (fingerprint, Plan),
+    # or None if every subscription gets a plan of its own
+    _interned = {}
+    
+    
+    def __init__(self, parent = None, **kwargs):
+        object.__setattr__(self, '_shared', None)
+        super(Plan, self).__init__(parent, **kwargs)
+        
+        
+    def __setattr__(self, key, value):
+        if self._shared is not None:
+            raise AttributeError, 'This plan is shared by every subscription on it, and cannot be changed; change plan.unshared() instead.'
+        super(Plan, self).__setattr__(key, value)
+        
+        
+    @classmethod
+    def set_interning(cls, interning = True):
+        """Turn sharing of plans between subscriptions on or off for
+        every subscription loaded from now on. It is on by default."""
+        
+        cls._interned = {} if interning else None
+        
+        
+    @classmethod
+    def _decode_single(cls, xml, parent, lazy):
+        """Return the shared plan for the given plan XML, decoding it only
+        if this version of the plan hasn't been seen before. Every element
+        of the plan is part of its fingerprint, so a plan changed in
+        CheddarGetter becomes a new shared plan.
+        
+        This method should be considered opaque."""
+        
+        interned = cls._interned
+        if interned is None:
+            return cls.from_xml(xml, parent = parent, lazy = lazy)
+            
+        fingerprint = tuple([(element.tag, element.text) for element in xml.getiterator()])
+        key = xml.get('id')
+        entry = interned.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+            
+        # shared plans have no parent, and are never decoded lazily, since
+        # hydrating a plan would change it; nor are they ever in the
+        # identity map, which would refresh them (or hand out a private
+        # plan to share)
+        plan = cls()
+        plan._load_data_from_xml(xml, lazy = False)
+        shared = xmlbackend.backend.tostring(xml)
+        object.__setattr__(plan, '_shared', shared)
+        
+        # the plan's items are shared along with it, so they can't be
+        # changed either, and neither can the list of them
+        if 'items' in plan._relations:
+            items = tuple(plan._relations['items'])
+            for item in items:
+                object.__setattr__(item, '_shared', shared)
+            plan._relations['items'] = plan._relations['_clean_items'] = items
+        interned[key] = (fingerprint, plan)
+        return plan
+        
+        
+    def unshared(self):
+        """Return a version of this plan that can be changed: a copy
+        of it if it is shared, or the plan itself if it isn't."""
+        
+        if self._shared is None:
+            return self
+        # a copy, even if the identity map has another plan with this ID
+        plan = self.__class__()
+        plan._load_data_from_xml(xmlbackend.backend.fromstring(self._shared), lazy = False)
+        return plan
+        
+        
     @classmethod
     def all(cls):
         """Get all pricing plans in the product"""
         
-        # retrieve the plans from CheddarGetter
-        try: 
-            plans = []
-            xml = CheddarGetter.request('/plans/get/')
+        # if every plan is cached, there's no need to ask CheddarGetter
+        xml = cls._cache_get('*')
+        if xml is not None:
+            return [cls.from_xml(plan_xml) for plan_xml in xmlbackend.backend.fromstring(xml).findall('plan')]
+        
+        return cls._fill_cache()
+        
+        
+    @classmethod
+    def iter_all(cls):
+        """Iterate over all pricing plans in the product, yielding
+        each Plan as soon as it has been parsed."""
         
-            # make a list of Plan objects and return it
-            for plan_xml in xml.getiterator(tag = 'plan'):
-                plans.append(Plan.from_xml(plan_xml))
+        # retrieve the plans from CheddarGetter
+        try:
+            for plan_xml in cls._client.iterrequest('/plans/get/', 'plan'):
+                yield cls.from_xml(plan_xml)
                 
-            return plans
-            
         except NotFound:
-            return []
+            return
                 
     
     @classmethod
     def get(cls, code):
         """Get a single pricing plan"""
         
+        # the first miss loads every plan in the product with a single request,
+        # since a product rarely has more than a handful of plans
+        xml = cls._cache_get(code)
+        if xml is not None:
+            return cls.from_xml(xmlbackend.backend.fromstring(xml))
+        if cls._cache is not None:
+            for plan in cls._fill_cache():
+                if code in (plan._code, plan._id):
+                    return plan
+        
         # retrieve the plan from CheddarGetter
-        xml = CheddarGetter.request('/plans/get/', code = code)
+        xml = cls._client.request('/plans/get/', code = code)
         
         # return a plan object
-        for plan_xml in xml.getiterator(tag = 'plan'):
-            return Plan.from_xml(plan_xml)
+        for plan_xml in xml.getiterator('plan'):
+            cls._cache_set(plan_xml)
+            return cls.from_xml(plan_xml)
             
             
+    @classmethod
+    def _bind(cls, client):
+        """Return a copy of this class bound to the given client,
+        with a plan cache and shared plans of its own.
+        
+        This method should be considered opaque."""
+        
+        bound = super(Plan, cls)._bind(client)
+        bound._cache = LRUCache()
+        if cls._interned is not None:
+            bound._interned = {}
+        return bound
+        
+        
+    @classmethod
+    def _fill_cache(cls):
+        """Load every plan from CheddarGetter, storing each one in the plan
+        cache along with the full set. Return the list of plans.
+        
+        This method should be considered opaque."""
+        
+        plans = []
+        plans_xml = []
+        pending = []
+        try:
+            for plan_xml in cls._client.iterrequest('/plans/get/', 'plan'):
+                if cls._cache is not None:
+                    value = xmlbackend.backend.tostring(plan_xml)
+                    plans_xml.append(value)
+                    cls._cache_set(plan_xml, pending, value)
+                plans.append(cls.from_xml(plan_xml))
+        except NotFound:
+            pass
+            
+        if cls._cache is not None:
+            pending.append((cls._cache_key('*'), '<plans>%s</plans>' % ''.join(plans_xml)))
+            cls._cache.set_many(pending)
+        return plans
+        
+        
     def save(self):
         """Saving of plans through the API is not yet implemented
         in CheddarGetter."""
@@ -424,18 +1479,21 @@ class Plan(CheddarObject):
         # send the deletion request to CheddarGetter
         # note: CheddarGetter returns no response -- this is expected here
         try:
-            CheddarGetter.request('/plans/delete/', code = self._code, product_code = self._product_code)
+            self._client.request('/plans/delete/', code = self._code, product_code = self._product_code)
         except UnexpectedResponse:
             pass
             
+        # the cached plans are now out of date
+        self.clear_cache()
+            
             
     def is_free(self):
         """Return True if CheddarGetter considers this plan to be free,
         False otherwise."""
         
-        # allow a small tolerance due to the unreliability of floating
-        # point math in most languages (including Python)
-        total = self.setup_charge_amount + self.recurring_charge_amount
+        # amounts loaded from CheddarGetter are Decimals, but allow a small
+        # tolerance in case floats have been assigned locally
+        total = float(self.setup_charge_amount + self.recurring_charge_amount)
         return total < 0.000001 and total > -0.000001
         
         
@@ -454,9 +1512,37 @@ class Customer(CheddarObject):
     """An object representing a CheddarGetter customer."""
     
     
-    def __init__(self, **kwargs):
-        self.subscription = Subscription(parent = self)
-        super(Customer, self).__init__(**kwargs)
+    __slots__ = ()
+    _fields = (
+        ('first_name', to_text),
+        ('last_name', to_text),
+        ('company', to_text),
+        ('email', to_text),
+        ('gateway_token', to_text),
+        ('is_vat_exempt', to_int),
+        ('vat_number', to_text),
+        ('first_contact_datetime', to_datetime),
+        ('referer', to_text),
+        ('referer_host', to_text),
+        ('campaign_source', to_text),
+        ('campaign_medium', to_text),
+        ('campaign_term', to_text),
+        ('campaign_content', to_text),
+        ('campaign_name', to_text),
+        ('created_datetime', to_datetime),
+        ('modified_datetime', to_datetime),
+    )
+    _children = (
+        ('subscriptions', 'Subscription', SINGLE),
+    )
+    
+    
+    def __getattr__(self, key):
+        # every customer has a subscription; create an empty one on first use
+        if key == 'subscription' and key not in self._relations:
+            self.subscription = self._client.Subscription(parent = self)
+            
+        return super(Customer, self).__getattr__(key)
         
         
     @classmethod
@@ -465,7 +1551,7 @@ class Customer(CheddarObject):
         Functionally identical to Customer.search() called with
         no arguments."""
         
-        return Customer.search()
+        return cls.search()
     
     
     @classmethod
@@ -476,19 +1562,141 @@ class Customer(CheddarObject):
         To retrieve all customers, use Customer.all().
         To retrieve a single customer by ID or code, use Customer.get()."""
         
+        return list(cls.iter_search(**kwargs))
+        
+        
+    @classmethod
+    def iter_search(cls, **kwargs):
+        """Iterate over customers in the CheddarGetter product plan,
+        filtered by the provided keyword arguments.
+        
+        Each Customer is yielded as soon as its XML has been parsed,
+        so memory use stays flat no matter how many customers the
+        product has (except that, if there is a cache, the XML for every
+        customer is held until they have all been seen, and then cached).
+        Takes the same arguments as Customer.search()."""
+        
+        # every customer may be cached, if there's a cache
+        # and there are no criteria
+        if kwargs or cls._cache is None:
+            pending = None
+        else:
+            xml = cls._cache_get('*')
+            if xml is not None:
+                for customer_xml in xmlbackend.backend.fromstring(xml).findall('customer'):
+                    yield cls.from_xml(customer_xml)
+                return
+            pending = []
+            customers_xml = []
+            
         # retreive the set of customers
         try:
-            customers = []
-            xml = CheddarGetter.request('/customers/get/', **kwargs)
-            for customer_xml in xml.getiterator(tag='customer'):
-                customers.append(Customer.from_xml(customer_xml))
+            for customer_xml in cls._client.iterrequest('/customers/get/', 'customer', **kwargs):
+                if pending is not None:
+                    value = xmlbackend.backend.tostring(customer_xml)
+                    customers_xml.append(value)
+                    cls._cache_set(customer_xml, pending, value)
+                yield cls.from_xml(customer_xml)
                 
-            return customers
-
         except NotFound:
-            return []
+            pass
+            
+        # every customer has been seen; cache them all in one go
+        if pending is not None and cls._cache is not None:
+            pending.append((cls._cache_key('*'), '<customers>%s</customers>' % ''.join(customers_xml)))
+            cls._cache.set_many(pending)
 
 
+    @classmethod
+    def paged_search(cls, created_after, created_before = None, days = 30, workers = 4, **kwargs):
+        """Iterate over the customers created between two dates (both
+        included; created_before defaults to today), filtered by the
+        provided keyword arguments as in Customer.search().
+        
+        Rather than asking for every customer in one (possibly huge and
+        slow) response, the dates are split into windows of `days` days,
+        and up to `workers` windows are fetched at once. Customers are
+        yielded in window order, as soon as their window has arrived."""
+        
+        if created_before is None:
+            created_before = datetime.datetime.utcnow().date()
+        if isinstance(created_after, datetime.datetime):
+            created_after = created_after.date()
+        if isinstance(created_before, datetime.datetime):
+            created_before = created_before.date()
+            
+        def fetch(window):
+            try:
+                xml = cls._client.request('/customers/get/', created_after_date = window[0].strftime('%Y-%m-%d'),
+                    created_before_date = window[1].strftime('%Y-%m-%d'), **kwargs)
+            except NotFound:
+                return []
+            return xml.findall('customer')
+            
+        # a customer on the edge of two windows is only yielded once
+        seen = set()
+        for customers_xml in ParallelPages(fetch, date_windows(created_after, created_before, days), workers):
+            for customer_xml in customers_xml:
+                if customer_xml.get('id') not in seen:
+                    seen.add(customer_xml.get('id'))
+                    yield cls.from_xml(customer_xml)
+                    
+                    
+    @classmethod
+    def sync(cls, store, since = None, full = False):
+        """Bring a local store (see pycheddar.sync) up to date with
+        CheddarGetter, yielding a Delta for each customer that was created,
+        updated or deleted.
+        
+        Only customers changed since the store's checkpoint (or since the
+        given datetime, in UTC) are fetched. Deleted customers can only be
+        found by comparing against everything, so pass full = True (or
+        sync a store with no checkpoint) to do a full resync.
+        
+        Each delta is only recorded in the store once the consumer asks
+        for the next one, and the checkpoint is only moved forward once
+        every delta has been consumed, so a sync that is interrupted
+        (say, by an exception while applying a delta) yields that delta
+        again next time rather than losing it."""
+        
+        # note the time now, so that customers changing while the sync
+        # is running are picked up again next time
+        started = datetime.datetime.utcnow()
+        if since is None and not full:
+            since = store.get_checkpoint()
+            
+        kwargs = {}
+        if since is not None:
+            kwargs['changed_since'] = since.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+        
+        seen = set()
+        try:
+            for customer_xml in cls._client.iterrequest('/customers/get/', 'customer', **kwargs):
+                code = customer_xml.get('code')
+                seen.add(code)
+                
+                # compare the raw XML against the snapshot in the store
+                snapshot = xmlbackend.backend.tostring(customer_xml)
+                previous = store.get(code)
+                if previous == snapshot:
+                    continue
+                    
+                yield Delta(previous is None and CREATE or UPDATE, code, cls.from_xml(customer_xml))
+                store.set(code, snapshot)
+        except NotFound:
+            pass
+            
+        # anything in the store that CheddarGetter didn't send
+        # during a full resync has been deleted
+        if since is None:
+            for code in list(store.codes()):
+                if code not in seen:
+                    yield Delta(DELETE, code)
+                    store.delete(code)
+                    
+        store.set_checkpoint(started)
+        
+        
     @classmethod
     def get(cls, code):
         """Get a specific customer by the given customer code.
@@ -496,9 +1704,107 @@ class Customer(CheddarObject):
         Raises NotFound if the customer code does not exist
         in CheddarGetter."""
 
-        xml = CheddarGetter.request('/customers/get/', code = code)
-        for customer_xml in xml.getiterator(tag='customer'):
-            return Customer.from_xml(customer_xml)
+        # customers are only cached if Customer.set_cache() has been called
+        xml = cls._cache_get(code)
+        if xml is not None:
+            return cls.from_xml(xmlbackend.backend.fromstring(xml))
+            
+        xml = cls._client.request('/customers/get/', code = code)
+        for customer_xml in xml.getiterator('customer'):
+            cls._cache_set(customer_xml)
+            return cls.from_xml(customer_xml)
+            
+            
+    @classmethod
+    def get_many(cls, codes, workers = 8, search = None, **kwargs):
+        """Get several customers by code (or ID) at once. Return a
+        (customers, errors) tuple of dictionaries: customers maps each code
+        that was found to its Customer, and errors maps every other code
+        to the exception raised getting it (NotFound if it doesn't exist).
+        
+        Customers in the cache are taken from there. The rest are fetched
+        in one of two ways:
+        
+        * with a single search request, filtered by the keyword arguments
+          as in Customer.search(), keeping only the customers asked for.
+          CheddarGetter can't search for a list of codes, so this is only
+          the cheaper way when the search (or the product) is small enough;
+          it is used if search = True, or if there are keyword arguments
+          and search isn't False.
+        * otherwise, with a request for each customer, up to `workers`
+          at once."""
+        
+        customers = {}
+        errors = {}
+        
+        # take whatever is cached, and fetch each remaining code only once
+        wanted = []
+        for code in codes:
+            code = str(code)
+            if code in customers or code in wanted:
+                continue
+            xml = cls._cache_get(code)
+            if xml is not None:
+                customers[code] = cls.from_xml(xmlbackend.backend.fromstring(xml))
+            else:
+                wanted.append(code)
+        if not wanted:
+            return customers, errors
+            
+        if search is None:
+            search = bool(kwargs)
+        if search:
+            cls._search_many(wanted, customers, errors, kwargs)
+            return customers, errors
+            
+        def fetch(code):
+            try:
+                customer = cls.get(code)
+                if customer is None:
+                    raise NotFound, 'Customer not found'
+                return customer, None
+            except Exception, e:
+                return None, e
+                
+        for code, (customer, error) in zip(wanted, ParallelPages(fetch, wanted, workers)):
+            if error is None:
+                customers[code] = customer
+            else:
+                errors[code] = error
+        return customers, errors
+        
+        
+    @classmethod
+    def _search_many(cls, wanted, customers, errors, kwargs):
+        """Get the wanted customers with a single search request, filtered
+        by kwargs, adding them to customers and the codes that weren't
+        found (or the error the search failed with) to errors.
+        
+        This method should be considered opaque."""
+        
+        remaining = set(wanted)
+        try:
+            for customer_xml in cls._client.iterrequest('/customers/get/', 'customer', **kwargs):
+                # only decode the customers that were asked for
+                # (by code or by ID), and stop once they all have been
+                for code in (customer_xml.get('code'), customer_xml.get('id')):
+                    if code in remaining:
+                        if cls._cache is not None:
+                            cls._cache_set(customer_xml)
+                        customers[code] = cls.from_xml(customer_xml)
+                        remaining.discard(code)
+                        break
+                if not remaining:
+                    return
+        except NotFound:
+            pass
+        except Exception, e:
+            for code in remaining:
+                errors[code] = e
+            return
+            
+        for code in remaining:
+            errors[code] = NotFound('Customer not found')
     
     
     def validate(self):
@@ -524,8 +1830,15 @@ class Customer(CheddarObject):
     
     
     def save(self):
-        """Save this customer to CheddarGetter"""
+        """Save this customer to CheddarGetter, along with any changes
+        to its subscription.
+        
+        Inside a unit of work (see CheddarGetter.unit_of_work), the save
+        is put off until the unit of work is committed."""
         
+        if self._client._defer(self):
+            return self
+            
         # is this valid?
         self.validate()
         
@@ -545,22 +1858,39 @@ class Customer(CheddarObject):
                 if key in self.subscription:
                     kwargs['subscription[%s]' % key] = getattr(self.subscription, key)
             
-            xml = CheddarGetter.request('/customers/new/', product_code = self._product_code, code = self._code, **kwargs)
+            xml = self._client.request('/customers/new/', product_code = self._product_code, code = self._code, **kwargs)
         else:
-            # okay, this isn't new -- send the update request
-            xml = CheddarGetter.request('/customers/edit/', product_code = self._product_code, code = self._code, **kwargs)
+            # okay, this isn't new; if the subscription has been altered,
+            # save it too (this seems like expected behavior), in the
+            # same request
+            subscription = self.subscription
+            if not subscription._is_clean():
+                for key, value in subscription._build_kwargs().items():
+                    kwargs['subscription[%s]' % key] = value
+                    
+            # sanity check: has anything changed?
+            if len(kwargs) == 0:
+                return self
+                
+            # send the update request
+            xml = self._client.request('/customers/edit/', product_code = self._product_code, code = self._code, **kwargs)
+            
+            # the customer is about to be reloaded with a new subscription;
+            # make sure the old one doesn't look like it still needs saving
+            subscription._dirty = 0
+            subscription._clean_plan = subscription.plan
             
-            # if the subscription has been altered, save it too
-            # (this seems like expected behavior)
-            if not self.subscription._is_clean():
-                self.subscription.save()
+        # the cached copy of this customer is now out of date
+        self._cache_invalidate()
 
         # either way, I should get a well-formed customer XML response
         # that can now be loaded into this object
-        for customer_xml in xml.getiterator(tag='customer'):
+        for customer_xml in xml.getiterator('customer'):
             self._load_data_from_xml(customer_xml)
             break
             
+        # a new customer can now be tracked by its ID
+        self._identify()
         return self
     
 
@@ -569,7 +1899,8 @@ class Customer(CheddarObject):
         
         # CheddarGetter does not return a response to deletion
         # requests in the success case
-        xml = CheddarGetter.request('/customers/delete/', product_code = self._product_code, code = self._code)
+        xml = self._client.request('/customers/delete/', product_code = self._product_code, code = self._code)
+        self._cache_invalidate()
         
     
     def get_item(item_code):
@@ -595,22 +1926,56 @@ class Customer(CheddarObject):
             kwargs['description'] = description
         
         # send the request to CheddarGetter
-        xml = CheddarGetter.request('/customers/add-charge/', product_code = self._product_code, code = self.code, **kwargs)
+        xml = self._client.request('/customers/add-charge/', product_code = self._product_code, code = self.code, **kwargs)
+        self._cache_invalidate()
         
     
 class Subscription(CheddarObject):
     """An object representing a CheddarGetter subscription."""
     
-    def __init__(self, **kwargs):
-        self._clean_plan = self.plan = Plan()
-        super(Subscription, self).__init__(**kwargs)
-        
+    __slots__ = ()
+    _fields = (
+        ('gateway_token', to_text),
+        ('cc_first_name', to_text),
+        ('cc_last_name', to_text),
+        ('cc_company', to_text),
+        ('cc_country', to_text),
+        ('cc_address', to_text),
+        ('cc_city', to_text),
+        ('cc_state', to_text),
+        ('cc_zip', to_text),
+        ('cc_type', to_text),
+        ('cc_last_four', to_text),
+        ('cc_expiration_date', to_datetime),
+        ('canceled_datetime', to_datetime),
+        ('created_datetime', to_datetime),
+        ('cc_number', to_text),
+        ('cc_expiration', to_text),
+        ('cc_card_code', to_text),
+    )
+    _children = (
+        ('plans', 'Plan', SINGLE),
+        ('items', 'Item', MANY),
+        ('invoices', 'Invoice', MANY),
+    )
+    
     
+    @property
+    def plan_code(self):
+        """The code of the plan this subscription is on."""
+        
+        return self.plan.code
+        
+        
     def __getattr__(self, key):
         # plan_code is special; pull it from the Plan object
         if to_underscores(key) == 'plan_code':
             return self.plan.code
             
+        # every subscription has a plan; create an empty one on first use
+        if (key == 'plan' or key == '_clean_plan') and key not in self._relations:
+            self._relations[key] = self._client.Plan()
+            
         return super(Subscription, self).__getattr__(key)
         
         
@@ -644,7 +2009,7 @@ class Subscription(CheddarObject):
         # string for both, or a Plan object for self.plan -- in all three
         # cases, I want to write a Plan object to self.plan
         if to_underscores(key) == 'plan_code' or (key == 'plan' and not isinstance(value, Plan)):
-            self.plan = Plan.get(value)
+            self.plan = self._client.Plan.get(value)
         else:
             super(Subscription, self).__setattr__(key, value)
         
@@ -670,6 +2035,13 @@ class Subscription(CheddarObject):
         return True
         
         
+    def _is_clean(self):
+        """Return True if neither the fields nor the plan
+        of this subscription have been changed."""
+        
+        return self._dirty == 0 and self.plan == self._clean_plan
+        
+        
     def _build_kwargs(self):
         """Build keyword arguments. Make sure plan code is included if appropriate."""
 
@@ -677,7 +2049,7 @@ class Subscription(CheddarObject):
         required_if_canceled = ['cc_first_name', 'cc_last_name', 'cc_zip']
         if self.canceled_datetime:
             for key in required_if_canceled:
-                del self._clean_data[key]
+                self._dirty |= self._bit(key)
 
         # run the superclass method
         kwargs = super(Subscription, self)._build_kwargs()
@@ -697,6 +2069,10 @@ class Subscription(CheddarObject):
         if self.is_new() is True:
             self.customer.save()
             return self
+            
+        # inside a unit of work, the changes go out with the customer's
+        if 'customer' in self._relations and self._client._defer(self.customer):
+            return self
 
         # sanity check: has anything changed?
         kwargs = self._build_kwargs()
@@ -705,11 +2081,12 @@ class Subscription(CheddarObject):
             
         # this is an object being edited; update the subscription
         # by itself at CheddarGetter
-        xml = CheddarGetter.request('/customers/edit-subscription/', product_code = self._product_code, code = self.customer.code, **kwargs)
+        xml = self._client.request('/customers/edit-subscription/', product_code = self._product_code, code = self.customer.code, **kwargs)
+        self.customer._cache_invalidate()
 
         # either way, I should get a well-formed customer XML response
         # that can now be loaded into this object
-        for subscription_xml in xml.getiterator(tag='subscription'):
+        for subscription_xml in xml.getiterator('subscription'):
             self._load_data_from_xml(subscription_xml)
             break
             
@@ -720,7 +2097,8 @@ class Subscription(CheddarObject):
         """Remove this subscription from CheddarGetter."""
         
         # this is straightforward: just run the cancellation
-        xml = CheddarGetter.request('/customers/cancel/', product_code = self._product_code, code = self.customer.code)
+        xml = self._client.request('/customers/cancel/', product_code = self._product_code, code = self.customer.code)
+        self.customer._cache_invalidate()
         
         
     def cancel(self):
@@ -735,29 +2113,52 @@ class Subscription(CheddarObject):
 class Item(CheddarObject):
     """An object representing a distinct item."""
     
+    # the XML of the shared plan this item belongs to (see
+    # Plan.set_interning), or None if it isn't shared
+    __slots__ = ('_shared',)
+    _fields = (
+        ('name', to_text),
+        ('quantity_included', to_decimal),
+        ('is_periodic', to_int),
+        ('overage_amount', to_decimal),
+        ('quantity', to_decimal),
+        ('created_datetime', to_datetime),
+        ('modified_datetime', to_datetime),
+    )
+    
+    
+    def __init__(self, parent = None, **kwargs):
+        object.__setattr__(self, '_shared', None)
+        super(Item, self).__init__(parent, **kwargs)
+        
+        
     def __setattr__(self, key, value):
         """Set an arbitrary attribute."""
         
+        if self._shared is not None:
+            raise AttributeError, 'This item belongs to a plan shared by every subscription on it, and cannot be changed; change plan.unshared() instead.'
+            
         # CheddarGetter inconsistently uses "quantity included" and "quantity"
         # depending on whether this is attached to a customer or a plan -- always
         # allow "quantity" here
-        if key == 'quantity' and hasattr(self, 'plan'):
+        if key == 'quantity' and 'plan' in self._relations:
             return setattr(self, 'quantity_included', value)
             
         # regular case
         super(Item, self).__setattr__(key, value)
         
         
-    def __getattr__(self, key):
-        """Get an arbitrary attribute."""
-        
-        # intercept "quantity" and allow it to stand in for "quantity_included"
-        # if this item is a member of a plan
-        if key == 'quantity' and hasattr(self, 'plan'):
-            return getattr(self, 'quantity_included')
+    @property
+    def quantity(self):
+        """The quantity of this item; for an item that is a member of a
+        plan, this is the quantity included in the plan."""
         
-        # regular case
-        return super(Item, self).__getattr__(key)
+        if 'plan' in self._relations:
+            return self.quantity_included
+        try:
+            return self._data['quantity']
+        except KeyError:
+            return self.__getattr__('quantity')
         
     
     def validate(self):
@@ -786,17 +2187,49 @@ class Item(CheddarObject):
         self.validate()
     
         # okay, save to CheddarGetter
-        xml = CheddarGetter.request('/customers/set-item-quantity/', product_code = self._product_code, item_code = self.code, code = self.customer.code)
+        xml = self._client.request('/customers/set-item-quantity/', product_code = self._product_code, item_code = self.code, code = self.customer.code)
+        self.customer._cache_invalidate()
         self._load_data_from_xml(xml)
         return self
 
 
 class Invoice(CheddarObject):
     """An object representing a CheddarGetter invoice."""
+    
+    __slots__ = ()
+    _fields = (
+        ('number', to_int),
+        ('type', to_text),
+        ('billing_datetime', to_datetime),
+        ('created_datetime', to_datetime),
+    )
+    _children = (
+        ('charges', 'Charge', MANY),
+    )
 
 
 class Charge(CheddarObject):
     """An object representing a CheddarGetter charge."""
+    
+    __slots__ = ()
+    _fields = (
+        ('type', to_text),
+        ('quantity', to_decimal),
+        ('each_amount', to_decimal),
+        ('description', to_text),
+        ('created_datetime', to_datetime),
+    )
+
+# generate the accessors for each model's schema
+for name in CheddarGetter._models:
+    globals()[name]._compile_accessors()
+
+# the default client, used through the CheddarGetter class itself;
+# its models are the classes in this module
+CheddarGetter._default = CheddarGetter()
+CheddarObject._client = CheddarGetter._default
+for name in CheddarGetter._models:
+    setattr(CheddarGetter._default, name, globals()[name])
 
 # if we are using Django, and if the appropriate settings
 # are already set in Django, just import them automatically
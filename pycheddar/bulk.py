@@ -0,0 +1,182 @@
+import threading
+import time
+from Queue import Queue, Empty
+from exceptions import *
+
+
+class RateLimiter(object):
+    """Allow at most `rate` operations per second, shared between threads."""
+
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+
+    def wait(self):
+        """Block until the next operation is allowed."""
+
+        self._lock.acquire()
+        try:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + 1.0 / self.rate
+        finally:
+            self._lock.release()
+
+        if start > now:
+            time.sleep(start - now)
+
+
+class BulkResult(object):
+    """The outcome of saving a single object in a bulk save."""
+
+
+    def __init__(self, obj, error = None, elapsed = 0.0):
+        self.obj = obj
+        self.error = error
+        self.elapsed = elapsed
+
+
+    @property
+    def ok(self):
+        """Return True if the object was saved, False otherwise."""
+
+        return self.error is None
+
+
+    def __repr__(self):
+        if self.ok:
+            return '<BulkResult %s: saved>' % self.obj.code
+        return '<BulkResult %s: %s>' % (self.obj.code, self.error.__class__.__name__)
+
+
+class BulkSave(object):
+    """Save many objects to CheddarGetter at once.
+
+    Every object is validated before anything is sent. The valid ones are
+    then saved by `concurrency` worker threads, at no more than `rate`
+    saves per second if a rate is given. Iterating over this object yields
+    a BulkResult for each object as soon as it has been saved or has
+    failed, in completion order.
+
+    Requests share CheddarGetter's connection pool, so concurrency beyond
+    the pool size (see CheddarGetter.set_pool_size) only adds waiting."""
+
+
+    def __init__(self, objects, concurrency = 4, rate = None):
+        self.objects = objects
+        self.concurrency = concurrency
+        self.limiter = None
+        if rate is not None:
+            self.limiter = RateLimiter(rate)
+
+        self.saved = 0
+        self.failed = 0
+        self.started = None
+        self.finished = None
+
+
+    def __iter__(self):
+        self.started = time.time()
+        pending = Queue()
+        results = Queue()
+        stop = threading.Event()
+
+        try:
+            # validate everything up front; objects that fail are reported
+            # straight away and never sent to CheddarGetter
+            count = 0
+            for obj in self.objects:
+                try:
+                    if obj.validate() is False:
+                        raise ValidationError, 'Validation failed.'
+                except ValidationError, e:
+                    yield self._record(BulkResult(obj, e))
+                    continue
+                pending.put(obj)
+                count += 1
+
+            # start the workers
+            for i in range(min(self.concurrency, count)):
+                worker = threading.Thread(target = self._work, args = (pending, results, stop))
+                worker.daemon = True
+                worker.start()
+
+            # hand the results back as they come in
+            for i in range(count):
+                yield self._record(results.get())
+        finally:
+            # if the caller stopped iterating early, the workers
+            # should stop picking up new objects
+            stop.set()
+            self.finished = time.time()
+
+
+    def stats(self):
+        """Return a dictionary with the number of objects saved and failed,
+        the elapsed time in seconds and the throughput in saves per second."""
+
+        elapsed = 0.0
+        if self.started is not None:
+            elapsed = (self.finished or time.time()) - self.started
+
+        per_second = 0.0
+        if elapsed > 0:
+            per_second = (self.saved + self.failed) / elapsed
+
+        return {
+            'saved': self.saved,
+            'failed': self.failed,
+            'elapsed': elapsed,
+            'per_second': per_second,
+        }
+
+
+    def _work(self, pending, results, stop):
+        """Save objects from the pending queue until it is empty.
+
+        This method should be considered opaque."""
+
+        while not stop.isSet():
+            try:
+                obj = pending.get_nowait()
+            except Empty:
+                return
+
+            if self.limiter is not None:
+                self.limiter.wait()
+
+            start = time.time()
+            try:
+                obj.save()
+                results.put(BulkResult(obj, elapsed = time.time() - start))
+            except Exception, e:
+                results.put(BulkResult(obj, e, time.time() - start))
+
+
+    def _record(self, result):
+        """Count a result before handing it back.
+
+        This method should be considered opaque."""
+
+        if result.ok:
+            self.saved += 1
+        else:
+            self.failed += 1
+        return result
+
+
+def bulk_save(objects, concurrency = 4, rate = None):
+    """Save many objects (usually customers) to CheddarGetter at once.
+    Return a BulkSave; iterate over it to get each result as it completes.
+
+        >>> job = bulk_save(customers, concurrency = 8, rate = 20)
+        >>> for result in job:
+        ...     if not result.ok:
+        ...         print result.obj.code, result.error
+        >>> job.stats()
+    """
+
+    return BulkSave(objects, concurrency, rate)
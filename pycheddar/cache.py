@@ -0,0 +1,310 @@
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from collections import deque
+
+
+class Cache(object):
+    """Base class for the caches pycheddar keeps in front of CheddarGetter.
+
+    Values are always strings (raw XML), so a backend shared between
+    processes, such as memcached, only needs to subclass this and
+    implement _get, set, delete and clear."""
+
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key):
+        """Return the value stored under key, or None if there is none."""
+
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+
+    def stats(self):
+        """Return a dictionary with the hit and miss counts."""
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+    def _get(self, key):
+        """Return the value stored under key, or None if there is none.
+        Backends must implement this method."""
+
+        raise NotImplementedError
+
+
+    def set(self, key, value):
+        """Store a value under key."""
+
+        raise NotImplementedError
+
+
+    def set_many(self, items):
+        """Store several (key, value) pairs. Backends that can store
+        them more cheaply all at once should override this."""
+
+        for key, value in items:
+            self.set(key, value)
+
+
+    def delete(self, key):
+        """Remove key from the cache, if it is there."""
+
+        raise NotImplementedError
+
+
+    def clear(self):
+        """Remove everything from the cache."""
+
+        raise NotImplementedError
+
+
+class LRUCache(Cache):
+    """An in-process cache holding up to `size` values, each for
+    at most `ttl` seconds. When the cache is full, the least recently
+    used value is evicted."""
+
+
+    def __init__(self, size = 128, ttl = 300):
+        super(LRUCache, self).__init__()
+        self.size = size
+        self.ttl = ttl
+        self._data = {}
+        self._tick = 0
+        self._lock = threading.Lock()
+
+        # (tick, key) pairs, least recently used first; a pair is stale
+        # once its key has been used again (or removed) since
+        self._order = deque()
+
+
+    def _get(self, key):
+        self._lock.acquire()
+        try:
+            if key not in self._data:
+                return None
+
+            # throw the value away if it has expired
+            value, expires, used = self._data[key]
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return None
+
+            # note that this value was just used
+            self._touch(key, value, expires)
+            return value
+        finally:
+            self._lock.release()
+
+
+    def set(self, key, value):
+        self._lock.acquire()
+        try:
+            # make room by evicting the least recently used value,
+            # skipping the stale pairs in front of it
+            if key not in self._data:
+                while len(self._data) >= self.size:
+                    tick, oldest = self._order.popleft()
+                    entry = self._data.get(oldest)
+                    if entry is not None and entry[2] == tick:
+                        del self._data[oldest]
+
+            expires = None
+            if self.ttl is not None:
+                expires = time.time() + self.ttl
+
+            self._touch(key, value, expires)
+        finally:
+            self._lock.release()
+
+
+    def _touch(self, key, value, expires):
+        """Store a value as the most recently used one. The lock must
+        be held.
+
+        This method should be considered opaque."""
+
+        self._tick += 1
+        self._data[key] = (value, expires, self._tick)
+        self._order.append((self._tick, key))
+
+        # reads leave stale pairs behind; once they outnumber the live
+        # ones, rebuild the order from the live values
+        if len(self._order) > 2 * len(self._data) + 16:
+            ticks = sorted((entry[2], k) for k, entry in self._data.iteritems())
+            self._order = deque(ticks)
+
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+        finally:
+            self._lock.release()
+
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._data.clear()
+            self._order.clear()
+        finally:
+            self._lock.release()
+
+
+    def stats(self):
+        stats = super(LRUCache, self).stats()
+        stats['size'] = len(self._data)
+        return stats
+
+
+class SQLiteCache(Cache):
+    """A cache kept in a SQLite database file, so that it survives between
+    runs and can be shared by processes on the same machine. Each value is
+    kept for at most `ttl` seconds, compressed with zlib if `compress` is
+    set (XML compresses very well, so this usually makes reads faster)."""
+
+
+    def __init__(self, filename, ttl = 3600, compress = True):
+        super(SQLiteCache, self).__init__()
+        self.filename = filename
+        self.ttl = ttl
+        self.compress = compress
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+        connection.commit()
+
+
+    def _connection(self):
+        """Return this thread's connection to the database; SQLite
+        connections can't be shared between threads.
+
+        This method should be considered opaque."""
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.filename, timeout = 30)
+            connection.text_factory = str
+
+            # let readers carry on while another process writes
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+        return connection
+
+
+    def _get(self, key):
+        row = self._connection().execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        # expired values are left for the next set() to overwrite
+        value, expires = row
+        if expires is not None and expires < time.time():
+            return None
+
+        value = str(value)
+        if self.compress:
+            value = zlib.decompress(value)
+        return value
+
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+
+    def set_many(self, items):
+        """Store several (key, value) pairs in a single transaction."""
+
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+
+        rows = []
+        for key, value in items:
+            if self.compress:
+                value = zlib.compress(value)
+            rows.append((key, sqlite3.Binary(value), expires))
+
+        connection = self._connection()
+        connection.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', rows)
+        connection.commit()
+
+
+    def delete(self, key):
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+        connection.commit()
+
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute('DELETE FROM cache')
+        connection.commit()
+
+
+    def stats(self):
+        stats = super(SQLiteCache, self).stats()
+        stats['size'] = self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        return stats
+
+
+class IdentityMap(object):
+    """Keeps track of the live objects of one kind by ID, so that the same
+    object is never held twice. Objects are weakly referenced: an object
+    drops out of the map as soon as nothing else refers to it."""
+
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._objects = weakref.WeakValueDictionary()
+
+
+    def get(self, key):
+        """Return the live object with the given ID, or None if there is none."""
+
+        obj = self._objects.get(key)
+        if obj is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return obj
+
+
+    def add(self, key, obj):
+        """Keep track of an object under its ID."""
+
+        self._objects[key] = obj
+
+
+    def clear(self):
+        """Forget every object."""
+
+        self._objects.clear()
+
+
+    def stats(self):
+        """Return a dictionary with the hit and miss counts, and the
+        number of live objects. Each hit is an object that was refreshed
+        rather than loaded a second time."""
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._objects),
+        }
@@ -0,0 +1,70 @@
+import sys
+import threading
+
+
+class _Call(object):
+    """A call in flight, and eventually its outcome."""
+
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent identical calls: while a call for a key is in
+    flight, any other thread asking for the same key waits for it and
+    gets the same result (or the same exception) instead of making
+    its own call."""
+
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+
+    def do(self, key, func):
+        """Return func(), or the result of an identical call
+        already in flight for the same key."""
+
+        self._lock.acquire()
+        call = self._calls.get(key)
+        if call is not None:
+            self.shared += 1
+            self._lock.release()
+
+            call.done.wait()
+            if call.error is not None:
+                raise call.error[0], call.error[1], call.error[2]
+            return call.result
+
+        call = self._calls[key] = _Call()
+        self.calls += 1
+        self._lock.release()
+
+        try:
+            call.result = func()
+            return call.result
+        except:
+            call.error = sys.exc_info()
+            raise
+        finally:
+            self._lock.acquire()
+            try:
+                del self._calls[key]
+            finally:
+                self._lock.release()
+            call.done.set()
+
+
+    def stats(self):
+        """Return the number of calls made, and the number of
+        callers that shared another caller's call instead."""
+
+        return {
+            'calls': self.calls,
+            'shared': self.shared,
+        }
@@ -0,0 +1,99 @@
+"""Request paths compiled into templates for building requests quickly.
+
+Most requests pycheddar sends go to a handful of paths, and each path is
+sent the same few keyword arguments over and over. An Endpoint works out
+everything about its path once (the URL prefix, whether a code belongs in
+the URL or the POST body, and the encoded, camel-cased form of every key it
+has been sent), so building a request is just joining strings together."""
+import re
+from urllib import quote_plus
+from utils import to_camel_case, to_endpoint
+
+# paths and keys come from pycheddar itself, not users, so there are only
+# ever a few of each; the limits only guard against arbitrary paths
+_MEMO_SIZE = 1024
+_endpoints = {}
+
+_uuid = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+class Endpoint(object):
+    """A request path, compiled. Get one with endpoint()."""
+
+    __slots__ = ('path', 'name', 'prefix', 'creates', 'keys')
+
+
+    def __init__(self, path):
+        self.path = path.strip('/')
+        self.name = to_endpoint(path)
+        self.prefix = '/xml/' + self.path
+        # object creation requests send the code in the POST body
+        self.creates = self.path[-3:] == 'new'
+        # keyword argument -> its encoded, camel-cased form plus '='
+        self.keys = {}
+
+
+    def url(self, server, code = None, item_code = None, product_code = None):
+        """Return the URL for a request to this endpoint, with the code
+        or ID of the object it is about, if there is one. Pass a product
+        code of None to leave it off."""
+
+        parts = [server, self.prefix]
+        if code is not None and not self.creates:
+            # the code may be an ID instead; CheddarGetter needs to be told
+            if is_id(code):
+                parts.append('/id/')
+            else:
+                parts.append('/code/')
+            parts.append(code)
+
+        # CheddarGetter expects item_code in the URL, not the POST body
+        if item_code is not None:
+            parts.append('/itemCode/')
+            parts.append(item_code)
+
+        if product_code is not None:
+            parts.append('/productCode/')
+            parts.append(product_code)
+            parts.append('/')
+
+        return ''.join(parts)
+
+
+    def encode(self, kwargs):
+        """Return the urlencoded POST body for the given keyword
+        arguments, with their keys camel-cased as CheddarGetter expects.
+
+        Keys are sorted, so the same arguments always give the same body."""
+
+        keys = self.keys
+        parts = []
+        for key in sorted(kwargs):
+            try:
+                prefix = keys[key]
+            except KeyError:
+                prefix = quote_plus(to_camel_case(key)) + '='
+                if len(keys) < _MEMO_SIZE:
+                    keys[key] = prefix
+            parts.append(prefix + quote_plus(str(kwargs[key])))
+        return '&'.join(parts)
+
+
+def is_id(code):
+    """Return whether a code sent to CheddarGetter is really an ID."""
+
+    return len(code) == 36 and _uuid.match(code) is not None
+
+
+def endpoint(path):
+    """Return the compiled Endpoint for a request path."""
+
+    try:
+        return _endpoints[path]
+    except KeyError:
+        pass
+
+    value = Endpoint(path)
+    if len(_endpoints) < _MEMO_SIZE:
+        _endpoints[path] = value
+    return value
@@ -23,4 +23,10 @@ class GatewayConnectionError(MouseTrap):
     pass
     
 class ValidationError(MouseTrap):
+    pass
+    
+class PoolExhausted(MouseTrap):
+    pass
+    
+class CircuitOpen(MouseTrap):
     pass
\ No newline at end of file
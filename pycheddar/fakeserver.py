@@ -0,0 +1,429 @@
+"""An in-process stand-in for the CheddarGetter XML API.
+
+FakeCheddarGetter serves realistic payloads for the endpoints pycheddar
+uses, from an in-memory product, with configurable latency and error
+injection. It is meant for benchmarks and tests that must not touch
+https://cheddargetter.com:
+
+    >>> server = FakeCheddarGetter(latency = 0.05)
+    >>> server.populate(customers = 1000)
+    >>> CheddarGetter.set_server(server.start())
+    >>> CheddarGetter.set_product_code(server.product_code)
+    >>> len(Customer.all())
+    1000
+    >>> server.stop()
+"""
+import BaseHTTPServer
+import SocketServer
+import cgi
+import copy
+import datetime
+import random
+import socket
+import threading
+import time
+from decimal import Decimal
+from xml.etree import ElementTree
+
+PLAN = '''<plan id="%(id)s" code="%(code)s"><name>%(code)s Plan</name><description/><isActive>1</isActive><trialDays>0</trialDays><billingFrequency>monthly</billingFrequency><billingFrequencyPer>month</billingFrequencyPer><billingFrequencyUnit>months</billingFrequencyUnit><billingFrequencyQuantity>1</billingFrequencyQuantity><setupChargeCode>%(code)s_SETUP</setupChargeCode><setupChargeAmount>0.00</setupChargeAmount><recurringChargeCode>%(code)s_RECURRING</recurringChargeCode><recurringChargeAmount>%(amount)s</recurringChargeAmount><createdDatetime>2010-01-01T00:00:00+00:00</createdDatetime><items><item id="%(id)s-item" code="USERS"><name>Users</name><quantityIncluded>5</quantityIncluded><isPeriodic>0</isPeriodic><overageAmount>2.00</overageAmount><createdDatetime>2010-01-01T00:00:00+00:00</createdDatetime></item></items></plan>'''
+
+CHARGE = '''<charge id="%(id)s-charge-%(invoice)d" code="%(plan)s_RECURRING"><type>recurring</type><quantity>1</quantity><eachAmount>%(amount)s</eachAmount><description/><createdDatetime>2010-%(month)02d-01T00:00:00+00:00</createdDatetime></charge>'''
+
+INVOICE = '''<invoice id="%(id)s-invoice-%(invoice)d"><number>%(invoice)d</number><type>subscription</type><billingDatetime>2010-%(month)02d-01T00:00:00+00:00</billingDatetime><createdDatetime>2010-%(month)02d-01T00:00:00+00:00</createdDatetime><charges>%(charges)s</charges></invoice>'''
+
+CUSTOMER = '''<customer id="%(id)s" code="%(code)s"><firstName>%(first_name)s</firstName><lastName>%(last_name)s</lastName><company/><email>%(email)s</email><gatewayToken/><createdDatetime>%(created)s</createdDatetime><modifiedDatetime>%(created)s</modifiedDatetime><subscriptions><subscription id="%(id)s-subscription"><plans>%(plan)s</plans><gatewayToken/><ccFirstName>%(first_name)s</ccFirstName><ccLastName>%(last_name)s</ccLastName><ccZip>00501</ccZip><ccType>visa</ccType><ccLastFour>1111</ccLastFour><ccExpirationDate>2012-03-31T00:00:00+00:00</ccExpirationDate><canceledDatetime/><createdDatetime>2010-01-01T00:00:00+00:00</createdDatetime><items><item id="%(id)s-item" code="USERS"><name>Users</name><quantity>2</quantity><createdDatetime/><modifiedDatetime/></item></items><invoices>%(invoices)s</invoices></subscription></subscriptions></customer>'''
+
+
+def uuid(n):
+    """Return a CheddarGetter-style ID for the given number."""
+
+    return '%08x-0000-4000-8000-%012x' % (n, n)
+
+
+def plan_xml(n):
+    """Return the XML for the nth plan."""
+
+    return PLAN % {'id': uuid(n), 'code': 'PLAN_%d' % n, 'amount': '%d.00' % (n * 10)}
+
+
+def customer_xml(n, invoices = 12, plans = 5, code = None, first_name = None, last_name = None, email = None):
+    """Return the XML for the nth customer, on one of the first `plans`
+    plans, with `invoices` monthly invoices. Customers are created two
+    a day from the start of 2010."""
+
+    plan_n = n % plans
+    values = {'id': uuid(1000000 + n), 'plan': 'PLAN_%d' % plan_n, 'amount': '%d.00' % (plan_n * 10)}
+    invoice_xml = []
+    for i in range(invoices):
+        values.update(invoice = i, month = i % 12 + 1)
+        values['charges'] = CHARGE % values
+        invoice_xml.append(INVOICE % values)
+
+    return CUSTOMER % {
+        'id': values['id'],
+        'code': code or 'CUSTOMER_%d' % n,
+        'first_name': first_name or 'First%d' % n,
+        'last_name': last_name or 'Last%d' % n,
+        'email': email or 'customer%d@example.com' % n,
+        'created': (datetime.datetime(2010, 1, 1) + datetime.timedelta(hours = n * 12)).strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        'plan': plan_xml(plan_n),
+        'invoices': ''.join(invoice_xml),
+    }
+
+
+def _now():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+class FakeCheddarGetter(object):
+    """An in-memory CheddarGetter product served over HTTP on localhost.
+
+    Every response is delayed by `latency` seconds, and a further second
+    for every `rate` bytes in it if a rate is given (as large responses
+    take CheddarGetter longer to generate). A random `error_rate` fraction
+    of requests fail with `error_status` (502, a gateway connection
+    error, by default)."""
+
+
+    def __init__(self, product_code = 'FAKE', latency = 0.0, error_rate = 0.0, error_status = 502, seed = None, rate = None):
+        self.product_code = product_code
+        self.latency = latency
+        self.rate = rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._plans = []
+        self._customers = []
+        self._next = 0
+        self._lock = threading.RLock()
+        self._server = None
+
+
+    def populate(self, customers = 100, plans = 5, invoices = 12):
+        """Fill the product with generated plans and customers."""
+
+        self._lock.acquire()
+        try:
+            self._plans = [ElementTree.fromstring(plan_xml(n)) for n in range(plans)]
+            self._customers = [ElementTree.fromstring(customer_xml(n, invoices, plans)) for n in range(customers)]
+            self._next = customers
+        finally:
+            self._lock.release()
+
+
+    def start(self):
+        """Start serving on a free port in a background thread.
+        Return the server URL, suitable for CheddarGetter.set_server()."""
+
+        fake = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            # keep connections alive, as CheddarGetter does
+            protocol_version = 'HTTP/1.1'
+            wbufsize = -1
+
+            def setup(self):
+                # don't let Nagle's algorithm hold the body of a large
+                # response back waiting on a delayed ACK
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+            def do_POST(self):
+                length = int(self.headers.get('content-length') or 0)
+                status, content = fake.handle(self.path, self.rfile.read(length))
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/xml; charset=utf-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+            def process_request_thread(self, request, client_address):
+                # clients dropping keep-alive connections, or the process
+                # exiting with some still open, is expected
+                try:
+                    SocketServer.ThreadingMixIn.process_request_thread(self, request, client_address)
+                except:
+                    pass
+
+            def handle_error(self, request, client_address):
+                pass
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target = self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+
+    def stop(self):
+        """Stop serving."""
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+    def handle(self, path, body):
+        """Handle a request to the given path, with the given urlencoded
+        POST body. Return a (status, content) tuple.
+
+        This is what the HTTP server calls; it may also be called
+        directly to measure the fake API without any network."""
+
+        # the path looks like /xml/customers/edit/code/X/productCode/Y/
+        parts = [part for part in path.split('/') if part]
+        endpoint = '/'.join(parts[1:3])
+        params = dict(zip(parts[3::2], parts[4::2]))
+        data = dict((key, values[-1]) for key, values in cgi.parse_qs(body).items())
+
+        self._lock.acquire()
+        try:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        finally:
+            self._lock.release()
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self._error(self.error_status, 'Injected error')
+
+        if params.get('productCode') != self.product_code:
+            return self._error(404, 'Product not found')
+
+        handler = getattr(self, '_' + endpoint.replace('/', '_').replace('-', '_'), None)
+        if handler is None:
+            return self._error(404, 'Unknown endpoint')
+
+        self._lock.acquire()
+        try:
+            status, content = handler(params, data)
+        finally:
+            self._lock.release()
+
+        if self.rate:
+            time.sleep(len(content) / float(self.rate))
+        return status, content
+
+
+    def stats(self):
+        """Return the number of requests made to each endpoint."""
+
+        return dict(self.requests)
+
+
+    # ---- endpoints
+
+    def _plans_get(self, params, data):
+        plans = self._plans
+        if 'code' in params or 'id' in params:
+            plans = [plan for plan in plans if self._matches(plan, params)]
+        if not plans:
+            return self._error(404, 'Plan not found')
+        return self._respond('plans', plans)
+
+
+    def _plans_delete(self, params, data):
+        plan = self._find(self._plans, params)
+        if plan is None:
+            return self._error(404, 'Plan not found')
+        self._plans.remove(plan)
+        return 200, ''
+
+
+    def _customers_get(self, params, data):
+        customers = self._customers
+        if 'code' in params or 'id' in params:
+            customers = [customer for customer in customers if self._matches(customer, params)]
+        if 'changedSince' in data:
+            customers = [customer for customer in customers if customer.findtext('modifiedDatetime') >= data['changedSince']]
+        if 'createdAfterDate' in data:
+            customers = [customer for customer in customers if customer.findtext('createdDatetime')[:10] >= data['createdAfterDate']]
+        if 'createdBeforeDate' in data:
+            customers = [customer for customer in customers if customer.findtext('createdDatetime')[:10] <= data['createdBeforeDate']]
+        if not customers:
+            if 'code' in params or 'id' in params:
+                return self._error(404, 'Customer not found')
+            return self._error(404, 'No customers found')
+        return self._respond('customers', customers)
+
+
+    def _customers_new(self, params, data):
+        code = data.get('code')
+        if not code or not data.get('email'):
+            return self._error(400, 'A code and email address are required')
+        if self._find(self._customers, {'code': code}) is not None:
+            return self._error(400, 'Customer code is not unique')
+
+        plan = self._find(self._plans, {'code': data.get('subscription[planCode]')})
+        if plan is None:
+            return self._error(400, 'Plan not found')
+
+        customer = ElementTree.fromstring(customer_xml(self._next, 0, 1,
+            code = code, first_name = data.get('firstName'), last_name = data.get('lastName'), email = data.get('email')))
+        self._next += 1
+
+        subscription = customer.find('subscriptions/subscription')
+        plans = subscription.find('plans')
+        plans.remove(plans[0])
+        plans.append(copy.deepcopy(plan))
+        self._update(customer, data)
+        self._customers.append(customer)
+        return self._respond('customers', [customer])
+
+
+    def _customers_edit(self, params, data):
+        customer = self._find(self._customers, params)
+        if customer is None:
+            return self._error(404, 'Customer not found')
+
+        # the subscription may be edited along with the customer
+        if 'subscription[planCode]' in data:
+            if not self._switch_plan(customer, data.pop('subscription[planCode]')):
+                return self._error(400, 'Plan not found')
+
+        self._update(customer, data)
+        return self._respond('customers', [customer])
+
+
+    def _customers_edit_subscription(self, params, data):
+        customer = self._find(self._customers, params)
+        if customer is None:
+            return self._error(404, 'Customer not found')
+
+        if 'planCode' in data:
+            if not self._switch_plan(customer, data.pop('planCode')):
+                return self._error(400, 'Plan not found')
+
+        self._update(customer, dict(('subscription[%s]' % key, value) for key, value in data.items()))
+        return self._respond('customers', [customer])
+
+
+    def _customers_delete(self, params, data):
+        customer = self._find(self._customers, params)
+        if customer is None:
+            return self._error(404, 'Customer not found')
+        self._customers.remove(customer)
+        return 200, '<?xml version="1.0" encoding="UTF-8"?>\n<success/>'
+
+
+    def _customers_cancel(self, params, data):
+        customer = self._find(self._customers, params)
+        if customer is None:
+            return self._error(404, 'Customer not found')
+        customer.find('subscriptions/subscription/canceledDatetime').text = _now()
+        customer.find('modifiedDatetime').text = _now()
+        return self._respond('customers', [customer])
+
+
+    def _customers_add_charge(self, params, data):
+        customer = self._find(self._customers, params)
+        if customer is None:
+            return self._error(404, 'Customer not found')
+
+        invoices = customer.find('subscriptions/subscription/invoices')
+        invoice = ElementTree.SubElement(invoices, 'invoice', id = '%s-invoice-%d' % (customer.get('id'), len(invoices)))
+        for tag, value in (('number', str(len(invoices))), ('type', 'one-time'), ('billingDatetime', _now()), ('createdDatetime', _now())):
+            ElementTree.SubElement(invoice, tag).text = value
+
+        charges = ElementTree.SubElement(invoice, 'charges')
+        charge = ElementTree.SubElement(charges, 'charge', id = '%s-charge' % invoice.get('id'), code = data.get('chargeCode', ''))
+        for tag, value in (('type', 'custom'), ('quantity', data.get('quantity', '1')), ('eachAmount', data.get('eachAmount', '0.00')),
+                ('description', data.get('description')), ('createdDatetime', _now())):
+            ElementTree.SubElement(charge, tag).text = value
+
+        customer.find('modifiedDatetime').text = _now()
+        return self._respond('customers', [customer])
+
+
+    def _customers_set_item_quantity(self, params, data):
+        return self._change_item_quantity(params, lambda quantity: data.get('quantity', quantity))
+
+
+    def _customers_add_item_quantity(self, params, data):
+        return self._change_item_quantity(params, lambda quantity: str(Decimal(quantity) + Decimal(data.get('quantity', '1'))))
+
+
+    def _change_item_quantity(self, params, change):
+        customer = self._find(self._customers, params)
+        if customer is None:
+            return self._error(404, 'Customer not found')
+
+        for item in customer.findall('subscriptions/subscription/items/item'):
+            if item.get('code') == params.get('itemCode'):
+                item.find('quantity').text = change(item.findtext('quantity'))
+                item.find('modifiedDatetime').text = _now()
+                customer.find('modifiedDatetime').text = _now()
+                return self._respond('customers', [customer])
+
+        return self._error(404, 'Item not found')
+
+
+    # ---- helpers
+
+    def _matches(self, element, params):
+        if 'id' in params:
+            return element.get('id') == params['id']
+        return element.get('code') == params.get('code')
+
+
+    def _find(self, elements, params):
+        for element in elements:
+            if self._matches(element, params):
+                return element
+        return None
+
+
+    def _switch_plan(self, customer, code):
+        """Put a customer on the plan with the given code; return
+        False if there is no such plan."""
+
+        plan = self._find(self._plans, {'code': code})
+        if plan is None:
+            return False
+        plans = customer.find('subscriptions/subscription/plans')
+        plans.remove(plans[0])
+        plans.append(copy.deepcopy(plan))
+        return True
+
+
+    def _update(self, customer, data):
+        """Apply posted fields to a customer; subscription[...]
+        fields go to the customer's subscription."""
+
+        subscription = customer.find('subscriptions/subscription')
+        for key, value in data.items():
+            target = customer
+            if key.startswith('subscription['):
+                target = subscription
+                key = key[13:-1]
+
+            # credit card details are never echoed back
+            if key in ('code', 'planCode', 'ccNumber', 'ccCardCode'):
+                continue
+            if key == 'ccExpiration':
+                key = 'ccExpirationDate'
+
+            element = target.find(key)
+            if element is None:
+                element = ElementTree.SubElement(target, key)
+            element.text = value
+
+        customer.find('modifiedDatetime').text = _now()
+
+
+    def _respond(self, tag, elements):
+        return 200, '<?xml version="1.0" encoding="UTF-8"?>\n<%s>%s</%s>' % (
+            tag, ''.join(ElementTree.tostring(element) for element in elements), tag)
+
+
+    def _error(self, status, message):
+        return status, '<?xml version="1.0" encoding="UTF-8"?>\n<error id="%d" code="%d">%s</error>' % (
+            random.randint(1, 100000), status, message)
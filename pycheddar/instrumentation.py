@@ -0,0 +1,151 @@
+import bisect
+import threading
+import time
+from utils import to_endpoint
+
+
+class RequestEvent(object):
+    """What happened during a single request to CheddarGetter.
+
+    The endpoint is the API path without any codes or IDs (for instance
+    "customers/edit"). Times are in seconds; network_time covers sending
+    the request and receiving the whole response, parse_time covers
+    parsing the XML. Sizes are in bytes. exception is the name of the
+    exception class raised, if any. attempts counts retries as well as
+    the first try; it is 0 if the request was coalesced with an identical
+    one already in flight, and shared its result."""
+
+
+    def __init__(self, path):
+        self.endpoint = to_endpoint(path)
+        self.attempts = 0
+        self.started = time.time()
+        self.status = None
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.network_time = None
+        self.parse_time = None
+        self.total_time = None
+        self.exception = None
+
+
+    def __repr__(self):
+        return '<RequestEvent %s %s %.1fms>' % (self.endpoint, self.status, (self.total_time or 0) * 1000)
+
+
+class Histogram(object):
+    """An observer that collects request latencies into a histogram per
+    endpoint, for export as percentiles:
+
+        >>> histogram = Histogram()
+        >>> CheddarGetter.add_observer(histogram)
+        >>> histogram.summary()
+        {'customers/get': {'count': 10, 'errors': 0, 'p50': 0.12, 'p90': 0.2, 'p99': 0.25, 'max': 0.25}}
+
+    Buckets grow by `factor` from `smallest` seconds up, so percentiles
+    are accurate to within that factor."""
+
+
+    def __init__(self, smallest = 0.001, factor = 1.2, largest = 120.0):
+        self.bounds = []
+        bound = smallest
+        while bound < largest:
+            self.bounds.append(bound)
+            bound *= factor
+        self.bounds.append(largest)
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+
+    def __call__(self, event):
+        """Record a RequestEvent."""
+
+        self._lock.acquire()
+        try:
+            if event.endpoint not in self._endpoints:
+                self._endpoints[event.endpoint] = {
+                    'counts': [0] * (len(self.bounds) + 1),
+                    'count': 0,
+                    'errors': 0,
+                    'max': 0.0,
+                }
+            stats = self._endpoints[event.endpoint]
+            stats['counts'][bisect.bisect_left(self.bounds, event.total_time)] += 1
+            stats['count'] += 1
+            stats['max'] = max(stats['max'], event.total_time)
+            if event.exception is not None:
+                stats['errors'] += 1
+        finally:
+            self._lock.release()
+
+
+    def percentile(self, endpoint, percent):
+        """Return the given percentile (0-100) of the request time for an
+        endpoint, in seconds, or None if there have been no requests."""
+
+        self._lock.acquire()
+        try:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                return None
+            return self._percentile(stats, percent)
+        finally:
+            self._lock.release()
+
+
+    def summary(self):
+        """Return a dictionary of request counts, error counts and p50, p90,
+        p99 and maximum request times for each endpoint."""
+
+        # take a copy of the stats, so that requests recorded (or a reset)
+        # in the meantime don't change them from under us
+        self._lock.acquire()
+        try:
+            endpoints = {}
+            for endpoint, stats in self._endpoints.iteritems():
+                stats = dict(stats)
+                stats['counts'] = list(stats['counts'])
+                endpoints[endpoint] = stats
+        finally:
+            self._lock.release()
+
+        summary = {}
+        for endpoint, stats in endpoints.iteritems():
+            summary[endpoint] = {
+                'count': stats['count'],
+                'errors': stats['errors'],
+                'p50': self._percentile(stats, 50),
+                'p90': self._percentile(stats, 90),
+                'p99': self._percentile(stats, 99),
+                'max': stats['max'],
+            }
+        return summary
+
+
+    def _percentile(self, stats, percent):
+        """Return the given percentile of the request time
+        recorded in an endpoint's stats.
+
+        This method should be considered opaque."""
+
+        # walk the buckets until enough requests have been seen,
+        # and report the upper bound of that bucket
+        wanted = stats['count'] * percent / 100.0
+        seen = 0
+        for index, count in enumerate(stats['counts']):
+            seen += count
+            if count and seen >= wanted:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], stats['max'])
+                return stats['max']
+        return stats['max']
+
+
+    def reset(self):
+        """Forget everything recorded so far."""
+
+        self._lock.acquire()
+        try:
+            self._endpoints = {}
+        finally:
+            self._lock.release()
@@ -0,0 +1,105 @@
+import datetime
+import sys
+import threading
+from Queue import Queue, Empty
+
+
+def date_windows(start, end, days):
+    """Split the dates from start to end (both included) into windows
+    of at most `days` days, returning a list of (first, last) pairs.
+    Raise ValueError if `days` is less than one."""
+
+    if days < 1:
+        raise ValueError, 'Windows must be at least one day long, not %r.' % days
+
+    windows = []
+    step = datetime.timedelta(days = days)
+    while start <= end:
+        last = min(start + step - datetime.timedelta(days = 1), end)
+        windows.append((start, last))
+        start = last + datetime.timedelta(days = 1)
+    return windows
+
+
+class _Page(object):
+    """A page being fetched, and eventually its result."""
+
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ParallelPages(object):
+    """Fetch pages with up to `workers` threads at once, yielding each
+    page's result in order as soon as it (and every page before it) has
+    arrived.
+
+    Workers never get more than `ahead` pages in front of the page being
+    consumed, so a slow consumer doesn't end up with every page in memory.
+    If fetching a page raises, the exception is raised when that page is
+    reached. Iterating over this object more than once fetches the
+    pages again."""
+
+
+    def __init__(self, fetch, pages, workers = 4, ahead = None):
+        self.fetch = fetch
+        self.pages = list(pages)
+        self.workers = workers
+        self.ahead = ahead or workers * 2
+
+
+    def __iter__(self):
+        pages = [_Page() for page in self.pages]
+        pending = Queue()
+        for index in range(len(pages)):
+            pending.put(index)
+
+        room = threading.Semaphore(self.ahead)
+        stop = threading.Event()
+        threads = []
+        for i in range(min(self.workers, len(pages))):
+            thread = threading.Thread(target = self._work, args = (pages, pending, room, stop))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        try:
+            for page in pages:
+                page.done.wait()
+                room.release()
+                if page.error is not None:
+                    raise page.error[0], page.error[1], page.error[2]
+                yield page.result
+        finally:
+            # the consumer may have stopped early; don't fetch any more,
+            # and wake any workers waiting for room
+            stop.set()
+            for thread in threads:
+                room.release()
+
+
+    def _work(self, pages, pending, room, stop):
+        """Fetch pages until there are none left.
+
+        This method should be considered opaque."""
+
+        while True:
+            room.acquire()
+            index = None
+            if not stop.is_set():
+                try:
+                    index = pending.get_nowait()
+                except Empty:
+                    pass
+            if index is None:
+                room.release()
+                return
+
+            page = pages[index]
+            try:
+                page.result = self.fetch(self.pages[index])
+            except:
+                page.error = sys.exc_info()
+            page.done.set()
@@ -0,0 +1,146 @@
+import httplib2
+import threading
+import time
+from exceptions import *
+
+
+class ConnectionPool(object):
+    """A bounded, thread-safe pool of persistent HTTP connections.
+
+    A single httplib2.Http object is not safe to share between threads,
+    so each request checks one out of the pool for its exclusive use and
+    returns it afterwards. The connections are kept alive between requests,
+    so a thread that gets an idle connection skips the TLS handshake."""
+
+
+    def __init__(self, size = 10, timeout = None):
+        """Create a pool holding at most `size` connections.
+
+        If `timeout` is set, a thread that waits longer than that many
+        seconds for a free connection gets PoolExhausted instead."""
+
+        self.size = size
+        self.timeout = timeout
+        self._credentials = []
+        self._connections = []
+        self._idle = []
+        self._waits = 0
+        self._lock = threading.Condition()
+
+
+    def add_credentials(self, username, password):
+        """Add credentials to every connection in the pool, including
+        the ones that have not been created yet."""
+
+        self._lock.acquire()
+        try:
+            self._credentials.append((username, password))
+            for http in self._connections:
+                http.add_credentials(username, password)
+        finally:
+            self._lock.release()
+
+
+    def resize(self, size):
+        """Change the maximum number of connections in the pool.
+
+        Shrinking the pool discards idle connections straight away;
+        connections that are in use are discarded when they come back."""
+
+        self._lock.acquire()
+        try:
+            self.size = size
+            while self._idle and len(self._connections) > size:
+                self._connections.remove(self._idle.pop())
+            self._lock.notifyAll()
+        finally:
+            self._lock.release()
+
+
+    def acquire(self):
+        """Check a connection out of the pool, waiting for one to be
+        released if the pool is exhausted."""
+
+        self._lock.acquire()
+        try:
+            deadline = None
+            waited = False
+            while not self._idle and len(self._connections) >= self.size:
+                # note that I had to wait; this is a useful number
+                # when deciding how large the pool should be
+                if not waited:
+                    self._waits += 1
+                    waited = True
+
+                if self.timeout is None:
+                    self._lock.wait()
+                    continue
+
+                if deadline is None:
+                    deadline = time.time() + self.timeout
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolExhausted, 'No connection became available within %s seconds.' % self.timeout
+                self._lock.wait(remaining)
+
+            # reuse an idle connection if there is one; the most recently
+            # used one is the most likely to still be open
+            if self._idle:
+                return self._idle.pop()
+
+            return self._create()
+        finally:
+            self._lock.release()
+
+
+    def release(self, http):
+        """Return a connection to the pool."""
+
+        self._lock.acquire()
+        try:
+            if len(self._connections) > self.size:
+                self._connections.remove(http)
+            else:
+                self._idle.append(http)
+            self._lock.notify()
+        finally:
+            self._lock.release()
+
+
+    def request(self, *args, **kwargs):
+        """Send a request on a pooled connection. Takes the same arguments
+        as httplib2.Http.request, and returns the same (response, content) tuple."""
+
+        http = self.acquire()
+        try:
+            return http.request(*args, **kwargs)
+        finally:
+            self.release(http)
+
+
+    def stats(self):
+        """Return a dictionary describing the current state of the pool."""
+
+        self._lock.acquire()
+        try:
+            return {
+                'size': self.size,
+                'in_use': len(self._connections) - len(self._idle),
+                'idle': len(self._idle),
+                'waits': self._waits,
+            }
+        finally:
+            self._lock.release()
+
+
+    def _create(self):
+        """Create a new connection with the pool's credentials.
+        Must be called with the lock held.
+
+        This method should be considered opaque."""
+
+        http = httplib2.Http()
+        for username, password in self._credentials:
+            http.add_credentials(username, password)
+        self._connections.append(http)
+        return http
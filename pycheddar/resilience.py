@@ -0,0 +1,140 @@
+import errno
+import httplib
+import httplib2
+import random
+import socket
+import threading
+import time
+from exceptions import *
+
+# failures that say nothing about the request itself, and may well not
+# happen again: the gateway or CheddarGetter being unreachable, a garbled
+# or unexpected response, or the connection dropping
+TRANSIENT = (GatewayConnectionError, UnexpectedResponse, socket.error, httplib.HTTPException, httplib2.HttpLib2Error)
+
+# the transient failures that mean CheddarGetter (or its gateway) can't be
+# reached, which are all a circuit breaker counts; an unexpected response
+# is still an answer, and some requests (such as deleting a plan)
+# succeed with one
+OUTAGE = (GatewayConnectionError, socket.error, httplib.HTTPException, httplib2.HttpLib2Error)
+
+# the errors a connection that could not be made at all fails with
+_CONNECT_ERRORS = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def never_sent(e):
+    """Return whether a request that failed with the given exception is
+    known never to have been sent to CheddarGetter: the circuit breaker
+    or the connection pool turned it away, or there was no connecting to
+    CheddarGetter at all. Anything else may have failed after CheddarGetter
+    received (and applied) the request."""
+
+    if isinstance(e, (CircuitOpen, PoolExhausted, httplib2.ServerNotFoundError, socket.gaierror)):
+        return True
+    return isinstance(e, socket.error) and not isinstance(e, socket.timeout) and e.errno in _CONNECT_ERRORS
+
+
+class RetryPolicy(object):
+    """Retry a request up to `retries` more times after a transient failure,
+    waiting a random time of up to backoff * 2 ** attempt seconds (capped at
+    `max_backoff`) in between, so that many clients retrying at once
+    don't all hit CheddarGetter at the same moment.
+
+    Only use this for requests that are safe to repeat."""
+
+
+    def __init__(self, retries = 3, backoff = 0.1, max_backoff = 5.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+
+    def delay(self, attempt):
+        """Return the number of seconds to wait before the given retry
+        (counting from zero)."""
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """Stop sending requests after `threshold` failures in a row to reach
+    CheddarGetter (see OUTAGE).
+
+    While the breaker is open, requests fail straight away with
+    CircuitOpen. After `reset_timeout` seconds it lets a single trial
+    request through (the breaker is half-open); if that succeeds the
+    breaker closes again, and if it fails the breaker opens again."""
+
+
+    def __init__(self, threshold = 5, reset_timeout = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self.rejected = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+
+    def before_request(self):
+        """Raise CircuitOpen if a request may not be sent right now."""
+
+        self._lock.acquire()
+        try:
+            if self.state == CLOSED:
+                return
+
+            # let one trial request through once the timeout has passed
+            if self.state == OPEN and time.time() - self.opened >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial = False
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+
+            self.rejected += 1
+            raise CircuitOpen, 'CheddarGetter is failing; not sending requests for now.'
+        finally:
+            self._lock.release()
+
+
+    def record_success(self):
+        """Note that a request reached CheddarGetter and got an answer."""
+
+        self._lock.acquire()
+        try:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+        finally:
+            self._lock.release()
+
+
+    def record_failure(self):
+        """Note that a request failed to reach CheddarGetter."""
+
+        self._lock.acquire()
+        try:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.state = OPEN
+                self.opened = time.time()
+                self._trial = False
+        finally:
+            self._lock.release()
+
+
+    def stats(self):
+        """Return a dictionary describing the breaker, for dashboards."""
+
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'opened': self.opened,
+            'rejected': self.rejected,
+        }
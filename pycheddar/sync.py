@@ -0,0 +1,163 @@
+import shelve
+import threading
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+
+
+class Delta(object):
+    """A single change found while syncing a local store with CheddarGetter."""
+
+
+    def __init__(self, action, code, customer = None):
+        self.action = action
+        self.code = code
+        self.customer = customer
+
+
+    def __repr__(self):
+        return '<Delta %s %s>' % (self.action, self.code)
+
+
+class Store(object):
+    """Base class for the local stores that Customer.sync() keeps
+    current. A store holds a snapshot (the raw customer XML) for each
+    customer code, and the checkpoint of the last successful sync."""
+
+
+    def get(self, code):
+        """Return the snapshot stored for a customer, or None."""
+
+        raise NotImplementedError
+
+
+    def set(self, code, snapshot):
+        """Store the snapshot for a customer."""
+
+        raise NotImplementedError
+
+
+    def delete(self, code):
+        """Remove a customer from the store."""
+
+        raise NotImplementedError
+
+
+    def codes(self):
+        """Return the codes of every customer in the store."""
+
+        raise NotImplementedError
+
+
+    def get_checkpoint(self):
+        """Return the time of the last successful sync, or None."""
+
+        raise NotImplementedError
+
+
+    def set_checkpoint(self, checkpoint):
+        """Record the time of a successful sync."""
+
+        raise NotImplementedError
+
+
+class MemoryStore(Store):
+    """A store that lives only as long as the process."""
+
+
+    def __init__(self):
+        self._snapshots = {}
+        self._checkpoint = None
+
+
+    def get(self, code):
+        return self._snapshots.get(code)
+
+
+    def set(self, code, snapshot):
+        self._snapshots[code] = snapshot
+
+
+    def delete(self, code):
+        self._snapshots.pop(code, None)
+
+
+    def codes(self):
+        return self._snapshots.keys()
+
+
+    def get_checkpoint(self):
+        return self._checkpoint
+
+
+    def set_checkpoint(self, checkpoint):
+        self._checkpoint = checkpoint
+
+
+class ShelveStore(Store):
+    """A store persisted to disk with the shelve module, so the
+    checkpoint survives between runs."""
+
+    _checkpoint_key = '__checkpoint__'
+
+
+    def __init__(self, filename):
+        self._shelf = shelve.open(filename)
+        self._lock = threading.Lock()
+
+
+    def get(self, code):
+        return self._shelf.get(self._key(code))
+
+
+    def set(self, code, snapshot):
+        self._lock.acquire()
+        try:
+            self._shelf[self._key(code)] = snapshot
+        finally:
+            self._lock.release()
+
+
+    def delete(self, code):
+        self._lock.acquire()
+        try:
+            key = self._key(code)
+            if key in self._shelf:
+                del self._shelf[key]
+        finally:
+            self._lock.release()
+
+
+    def codes(self):
+        return [key[9:] for key in self._shelf.keys() if key.startswith('customer:')]
+
+
+    def get_checkpoint(self):
+        return self._shelf.get(self._checkpoint_key)
+
+
+    def set_checkpoint(self, checkpoint):
+        self._lock.acquire()
+        try:
+            self._shelf[self._checkpoint_key] = checkpoint
+            self._shelf.sync()
+        finally:
+            self._lock.release()
+
+
+    def close(self):
+        """Write everything to disk and close the store."""
+
+        self._shelf.close()
+
+
+    def _key(self, code):
+        """Return the shelf key for a customer code; shelve
+        requires str keys.
+
+        This method should be considered opaque."""
+
+        if isinstance(code, unicode):
+            code = code.encode('utf-8')
+        return 'customer:' + code
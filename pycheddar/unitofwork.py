@@ -0,0 +1,57 @@
+class UnitOfWork(object):
+    """Put off saving customers and subscriptions until the end of a
+    with block, then save each changed customer once:
+
+        >>> with CheddarGetter.unit_of_work():
+        ...     customer.first_name = 'John'
+        ...     customer.save()
+        ...     customer.subscription.cc_zip = '77777'
+        ...     customer.subscription.save()
+
+    sends a single /customers/edit/ request, with the subscription's
+    changes alongside the customer's, however many times each object
+    was saved inside the block.
+
+    Nothing is sent if the block raises an exception. If a save fails
+    while the unit of work is being committed, the exception is raised
+    and the saves after it are not sent. Units of work nested in the
+    same thread join the outermost one."""
+
+
+    def __init__(self, client):
+        self.client = client
+        self._objects = []
+
+
+    def __enter__(self):
+        local = self.client._local
+        if not hasattr(local, 'units'):
+            local.units = []
+        local.units.append(self)
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self.client._local.units.pop()
+        if type is None:
+            self.commit()
+        return False
+
+
+    def add(self, obj):
+        """Note that an object should be saved when the unit of
+        work is committed."""
+
+        for pending in self._objects:
+            if pending is obj:
+                return
+        self._objects.append(obj)
+
+
+    def commit(self):
+        """Save every object added so far, in the order they were
+        first added."""
+
+        objects, self._objects = self._objects, []
+        for obj in objects:
+            obj.save()
@@ -0,0 +1,407 @@
+import json
+import os
+import threading
+import time
+from decimal import Decimal
+from exceptions import *
+from resilience import TRANSIENT, never_sent
+
+# the kinds of usage events
+CHARGE = 'charge'
+ADD_QUANTITY = 'add'
+SET_QUANTITY = 'set'
+
+
+class UsageBatcher(object):
+    """Buffer charges and item quantity changes in memory, and send them
+    to CheddarGetter in batches from a background thread:
+
+        >>> usage = CheddarGetter.batch_usage(log = '/var/lib/myapp/usage.log')
+        >>> usage.add_charge('JOHN_SMITH', 'API_CALLS', 'CALLS', amount = 0.01, quantity = 20)
+        >>> usage.add_item_quantity('JOHN_SMITH', 'STORAGE', 5)
+        >>> usage.close()
+
+    Events are merged before they are sent: charges that differ only in
+    quantity become a single charge for the total quantity, quantities
+    added to an item are summed, and setting an item's quantity replaces
+    whatever was pending for it. Everything pending is sent once
+    `max_size` events have been recorded, or once the oldest has waited
+    `max_delay` seconds, whichever comes first.
+
+    If a log file is given, every event is appended to it before it is
+    accepted (and synced to disk if `sync` is set), and whatever had not
+    been sent when the process stopped is recovered from it on startup.
+    Delivery is at least once: a crash in the middle of sending a batch
+    may send the request in flight at the time twice, but nothing is lost.
+
+    When a send fails in a transient way (see pycheddar.resilience), the
+    rest of the batch is put back and retried with the next one. So is the
+    event that failed, if it is sure not to have been applied: setting a
+    quantity can safely be sent again, but a charge or an added quantity
+    is only sent again if it never left (see never_sent), since it may
+    otherwise be applied twice. Any other failure is recorded in `failed`
+    as an (event, exception) pair, and on_error is called with the same
+    two arguments if it was given."""
+
+
+    def __init__(self, client, max_size = 1000, max_delay = 5.0, log = None, sync = False, on_error = None):
+        self.client = client
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.log = log
+        self.sync = sync
+        self.on_error = on_error
+        self.recorded = 0
+        self.sent = 0
+        self.failed = []
+        self._pending = {}
+        self._events = 0
+        self._oldest = None
+        self._seq = 0
+        self._file = None
+        self._stopped = False
+        self._lock = threading.Condition()
+        self._flushing = threading.Lock()
+
+        # pick up whatever a previous run left behind
+        if log is not None:
+            self._recover()
+
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+        return False
+
+
+    def add_charge(self, customer_code, charge_code, item_code, amount = 0.0, quantity = 1, description = None):
+        """Add a charge to a customer, as Customer.add_charge() would."""
+
+        self._record({
+            'op': CHARGE,
+            'customer': customer_code,
+            'charge': charge_code,
+            'item': item_code,
+            'amount': '%.2f' % float(amount),
+            'description': description,
+            'quantity': str(quantity),
+        })
+
+
+    def add_item_quantity(self, customer_code, item_code, quantity = 1):
+        """Add to the quantity of one of a customer's items."""
+
+        self._record({
+            'op': ADD_QUANTITY,
+            'customer': customer_code,
+            'item': item_code,
+            'quantity': str(quantity),
+        })
+
+
+    def set_item_quantity(self, customer_code, item_code, quantity):
+        """Set the quantity of one of a customer's items."""
+
+        self._record({
+            'op': SET_QUANTITY,
+            'customer': customer_code,
+            'item': item_code,
+            'quantity': str(quantity),
+        })
+
+
+    def flush(self):
+        """Send everything pending now, and wait for it to be sent."""
+
+        self._flushing.acquire()
+        try:
+            self._lock.acquire()
+            try:
+                batch = self._pending
+                self._pending = {}
+                self._events = 0
+                self._oldest = None
+            finally:
+                self._lock.release()
+
+            # keys are taken from the end of the list
+            keys = batch.keys()
+            keys.reverse()
+            while keys:
+                key = keys.pop()
+                event = batch[key]
+                unreachable = False
+                try:
+                    self._send(event)
+                except TRANSIENT + (CircuitOpen, PoolExhausted), e:
+                    # CheddarGetter can't be reached; keep the rest of the batch
+                    # for the next one, and this too unless it may already have
+                    # been applied and can't be applied twice
+                    if event['op'] == SET_QUANTITY or never_sent(e):
+                        keys.append(key)
+                        break
+                    self._fail(event, e)
+                    unreachable = True
+                except Exception, e:
+                    self._fail(event, e)
+                else:
+                    self.sent += 1
+
+                # either way, this event must not be sent again
+                self._write({'op': 'done', 'key': list(key), 'seq': event['seq']})
+                if unreachable:
+                    break
+
+            # whatever wasn't sent goes back for the next batch
+            if keys:
+                self._lock.acquire()
+                try:
+                    for key in keys:
+                        self._restore(key, batch[key])
+                finally:
+                    self._lock.release()
+
+            self._compact()
+        finally:
+            self._flushing.release()
+
+
+    def close(self):
+        """Send everything pending, stop the background thread
+        and close the log."""
+
+        self._lock.acquire()
+        try:
+            self._stopped = True
+            self._lock.notifyAll()
+        finally:
+            self._lock.release()
+        self._thread.join()
+
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    def stats(self):
+        """Return the number of events recorded, requests pending and
+        sent, and sends that failed for good."""
+
+        return {
+            'recorded': self.recorded,
+            'pending': len(self._pending),
+            'sent': self.sent,
+            'failed': len(self.failed),
+        }
+
+
+    def _record(self, event):
+        """Log an event and merge it into the pending events.
+
+        This method should be considered opaque."""
+
+        self._lock.acquire()
+        try:
+            self._seq += 1
+            event['seq'] = self._seq
+            self._write(event)
+            self._apply(event)
+            self.recorded += 1
+            self._events += 1
+            if self._oldest is None:
+                self._oldest = time.time()
+            if self._events >= self.max_size:
+                self._lock.notifyAll()
+        finally:
+            self._lock.release()
+
+
+    def _fail(self, event, e):
+        """Record an event that failed for good, and report it.
+
+        This method should be considered opaque."""
+
+        self.failed.append((event, e))
+        if self.on_error is not None:
+            self.on_error(event, e)
+
+
+    def _key(self, event):
+        """Return the key that events which can be merged share.
+
+        This method should be considered opaque."""
+
+        if event['op'] == CHARGE:
+            return (CHARGE, event['customer'], event['charge'], event['item'], event['amount'], event['description'])
+        return ('quantity', event['customer'], event['item'])
+
+
+    def _apply(self, event):
+        """Merge an event into the pending events.
+
+        This method should be considered opaque."""
+
+        key = self._key(event)
+        pending = self._pending.get(key)
+        if pending is None or event['op'] == SET_QUANTITY:
+            self._pending[key] = dict(event)
+            return
+
+        # charges and added quantities add up, on top of
+        # whatever quantity was pending
+        pending['quantity'] = str(Decimal(pending['quantity']) + Decimal(event['quantity']))
+        pending['seq'] = event['seq']
+
+
+    def _restore(self, key, event):
+        """Put an event that could not be sent back in front
+        of anything recorded for the same key since.
+
+        This method should be considered opaque."""
+
+        newer = self._pending.get(key)
+        self._pending[key] = event
+        if newer is not None:
+            self._apply(newer)
+
+        # retry with the next batch, once max_delay has passed
+        if self._oldest is None:
+            self._oldest = time.time()
+
+
+    def _send(self, event):
+        """Send a single (merged) event to CheddarGetter.
+
+        This method should be considered opaque."""
+
+        if event['op'] == CHARGE:
+            kwargs = {
+                'charge_code': event['charge'],
+                'each_amount': event['amount'],
+            }
+            if event['description'] is not None:
+                kwargs['description'] = event['description']
+            self.client.request('/customers/add-charge/', code = event['customer'], item_code = event['item'],
+                quantity = event['quantity'], **kwargs)
+        elif event['op'] == ADD_QUANTITY:
+            self.client.request('/customers/add-item-quantity/', code = event['customer'], item_code = event['item'],
+                quantity = event['quantity'])
+        else:
+            self.client.request('/customers/set-item-quantity/', code = event['customer'], item_code = event['item'],
+                quantity = event['quantity'])
+
+        # the cached copy of the customer is now out of date
+        self.client.Customer._cache_forget(event['customer'])
+
+
+    def _run(self):
+        """Flush whenever there are enough events, or the oldest has
+        waited long enough, until the batcher is closed.
+
+        This method should be considered opaque."""
+
+        self._lock.acquire()
+        try:
+            while not self._stopped:
+                if self._oldest is not None and (self._events >= self.max_size or time.time() - self._oldest >= self.max_delay):
+                    self._lock.release()
+                    try:
+                        self.flush()
+                    finally:
+                        self._lock.acquire()
+                    continue
+
+                timeout = self.max_delay
+                if self._oldest is not None:
+                    timeout = max(0, self._oldest + self.max_delay - time.time())
+                self._lock.wait(timeout)
+        finally:
+            self._lock.release()
+
+
+    def _write(self, entry):
+        """Append an entry to the log, if there is one.
+
+        This method should be considered opaque."""
+
+        if self._file is None:
+            return
+
+        self._lock.acquire()
+        try:
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+        finally:
+            self._lock.release()
+
+
+    def _recover(self):
+        """Load the events in the log that were never sent, and
+        rewrite the log with just those.
+
+        This method should be considered opaque."""
+
+        events = []
+        done = {}
+        if os.path.exists(self.log):
+            for line in open(self.log):
+                # the last line may have been cut short by a crash
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+
+                if entry['op'] == 'done':
+                    key = tuple(entry['key'])
+                    done[key] = max(done.get(key, 0), entry['seq'])
+                else:
+                    events.append(entry)
+
+        for event in events:
+            self._seq = max(self._seq, event['seq'])
+            if event['seq'] > done.get(self._key(event), 0):
+                self._apply(event)
+                self._events += 1
+        if self._pending:
+            self._oldest = time.time()
+
+        self._compact()
+
+
+    def _compact(self):
+        """Rewrite the log so that it holds only the pending events.
+
+        This method should be considered opaque."""
+
+        if self.log is None:
+            return
+
+        self._lock.acquire()
+        try:
+            if self._file is not None:
+                self._file.close()
+
+            # write the new log beside the old one, and swap it in
+            # only once it is safely on disk
+            temporary = self.log + '.tmp'
+            log = open(temporary, 'w')
+            for event in self._pending.values():
+                log.write(json.dumps(event) + '\n')
+            log.flush()
+            os.fsync(log.fileno())
+            log.close()
+            os.rename(temporary, self.log)
+
+            self._file = open(self.log, 'a')
+        finally:
+            self._lock.release()
@@ -1,26 +1,126 @@
+import datetime
 import re
+from decimal import Decimal, InvalidOperation
+
+# CheddarGetter uses a small, fixed set of field names, so conversions
+# are remembered; the limit only guards against arbitrary user keys
+_MEMO_SIZE = 1024
+_underscores = {}
+_camel_case = {}
+
+_upper = re.compile(r'([A-Z])')
+_underscore = re.compile(r'_+(.)')
 
 
 def to_underscores(key):
     """Utility method to convert a camel-cased key (like what is generally used in CheddarGetter)
     to an underscored key (like what is generally used in Python)."""
-    
-    match = re.search(r'([A-Z])', key)
-    while match:
-        char = match.groups()[0]
-        key = key.replace(char, '_' + char.lower())
-        match = re.search(r'([A-Z])', key)
-    
-    return key
-    
-    
+
+    try:
+        return _underscores[key]
+    except KeyError:
+        pass
+
+    value = _upper.sub(lambda match: '_' + match.group(1).lower(), key)
+    if len(_underscores) < _MEMO_SIZE:
+        _underscores[key] = value
+    return value
+
+
 def to_camel_case(key):
     """Convert an underscored key (like what is generally used in Python code)
     to a camel-cased key (like what is generally used in CheddarGetter)."""
-    
-    while '_' in key:
-        ix = key.index('_')
-        next = key[ix + 1].upper()
-        key = key[0:ix] + next + key[ix + 2:]
-        
-    return key
\ No newline at end of file
+
+    try:
+        return _camel_case[key]
+    except KeyError:
+        pass
+
+    value = _underscore.sub(lambda match: match.group(1).upper(), key)
+    if len(_camel_case) < _MEMO_SIZE:
+        _camel_case[key] = value
+    return value
+
+
+_integer = re.compile(r'^[\d]+$')
+_number = re.compile(r'^[\d.]+$')
+_datetime = re.compile(r'^(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.\d+)?(?:(Z)|([+-])(\d\d):?(\d\d))?$')
+
+
+def to_text(value):
+    """Return a text value sent by CheddarGetter unchanged. Codes such as
+    ZIP codes keep their leading zeros."""
+
+    return value
+
+
+def to_int(value):
+    """Convert an integer value sent by CheddarGetter."""
+
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def to_decimal(value):
+    """Convert an amount or quantity sent by CheddarGetter to a Decimal,
+    so that money is never subject to floating point rounding."""
+
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        return value
+
+
+def to_datetime(value):
+    """Convert an ISO 8601 timestamp sent by CheddarGetter to a naive
+    datetime in UTC. Values that aren't timestamps are returned unchanged."""
+
+    # CheddarGetter almost always sends "2010-01-31T12:00:00+00:00";
+    # slice that apart rather than running the regular expression
+    if len(value) == 25 and value[10] == 'T' and value[19:] == '+00:00':
+        try:
+            return datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19]))
+        except ValueError:
+            pass
+
+    match = _datetime.match(value)
+    if match is None:
+        return value
+
+    groups = match.groups()
+    value = datetime.datetime(*[int(i) for i in groups[:6]])
+
+    # move the time to UTC if an offset was sent
+    if groups[7] is not None:
+        offset = datetime.timedelta(hours = int(groups[8]), minutes = int(groups[9]))
+        if groups[7] == '+':
+            value -= offset
+        else:
+            value += offset
+
+    return value
+
+
+def guess_type(value):
+    """Convert a value of unknown type sent by CheddarGetter, turning
+    anything that looks numeric into an int or a float."""
+
+    if _integer.match(value):
+        return int(value)
+    elif _number.match(value):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+    return value
+
+
+def to_endpoint(path):
+    """Return the API endpoint for a request path, without any codes or
+    IDs: "/customers/edit/code/X/" becomes "customers/edit"."""
+
+    return '/'.join(path.strip('/').split('/')[:2])
@@ -0,0 +1,122 @@
+"""The XML parsers pycheddar can use to read CheddarGetter's responses.
+
+The fastest one available is picked when pycheddar is imported: lxml if it
+is installed, then the C-accelerated cElementTree, then the pure Python
+ElementTree. Pick another with set_backend():
+
+    >>> from pycheddar import xmlbackend
+    >>> xmlbackend.available()
+    ['lxml', 'celementtree', 'elementtree']
+    >>> xmlbackend.set_backend('celementtree')
+
+Every backend parses the response body as it came off the wire (a byte
+string), so the XML is never decoded or copied before parsing."""
+import threading
+from cStringIO import StringIO
+from xml.etree import ElementTree
+
+try:
+    from xml.etree import cElementTree
+except ImportError:
+    cElementTree = None
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+
+class Backend(object):
+    """An XML parser with the ElementTree API. Parse errors are
+    raised as SyntaxError (or a subclass of it) by every backend."""
+
+
+    def __init__(self, name, etree):
+        self.name = name
+        self.etree = etree
+
+
+    def fromstring(self, content):
+        """Parse a complete XML document and return its root element."""
+
+        return self.etree.fromstring(content)
+
+
+    def iterparse(self, content, events):
+        """Parse a complete XML document incrementally, yielding
+        (event, element) pairs as ElementTree.iterparse does."""
+
+        # a cStringIO over a byte string reads the string in place
+        return self.etree.iterparse(StringIO(content), events = events)
+
+
+    def tostring(self, element):
+        """Serialize an element back to XML."""
+
+        return self.etree.tostring(element)
+
+
+    def __repr__(self):
+        return '<Backend %s>' % self.name
+
+
+class LxmlBackend(Backend):
+    """lxml, which is faster than cElementTree but keeps comments and
+    processing instructions unless told not to; CheddarGetter's responses
+    have neither, but they would confuse the object decoders."""
+
+
+    def __init__(self, etree):
+        Backend.__init__(self, 'lxml', etree)
+        self._local = threading.local()
+
+
+    def fromstring(self, content):
+        # lxml parsers must not be shared between threads
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = self.etree.XMLParser(remove_comments = True,
+                remove_pis = True, resolve_entities = False)
+        return self.etree.fromstring(content, parser)
+
+
+    def iterparse(self, content, events):
+        return self.etree.iterparse(StringIO(content), events = events,
+            remove_comments = True, remove_pis = True, resolve_entities = False)
+
+
+# every backend available here, fastest first
+_backends = []
+if lxml_etree is not None:
+    _backends.append(LxmlBackend(lxml_etree))
+if cElementTree is not None:
+    _backends.append(Backend('celementtree', cElementTree))
+_backends.append(Backend('elementtree', ElementTree))
+
+# the backend in use
+backend = _backends[0]
+
+
+def available():
+    """Return the names of the backends available, fastest first."""
+
+    return [i.name for i in _backends]
+
+
+def get_backend(name = None):
+    """Return the backend with the given name, or the one in use if
+    no name is given. Raise ValueError if it isn't available."""
+
+    if name is None:
+        return backend
+    for i in _backends:
+        if i.name == name:
+            return i
+    raise ValueError, 'The "%s" XML backend is not available; choose from %s.' % (name, ', '.join(available()))
+
+
+def set_backend(name):
+    """Parse every response from now on with the named backend."""
+
+    global backend
+    backend = get_backend(name)